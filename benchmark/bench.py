@@ -0,0 +1,115 @@
+'''
+Benchmark of the tile and image drawing pipeline on seeded synthetic maps.
+
+Each map size is run in a separate process so that the peak memory of each size is measured separately. The time to plot the map is measured on its own and the tiles per second of each zoom level are from the time spent rendering, encoding and writing the tiles (see :class:`.Stats`), since :meth:`.Map.draw_zoom_levels` plots the map again before drawing. The results are written as JSON, by default to bench.json, e.g.
+
+::
+
+  python bench.py --sizes small medium --zooms 10 12 14 --output bench.json
+'''
+from sys import path, argv, executable
+path.insert(0, '..')
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+import subprocess
+import resource
+import platform
+import json
+import numpy as np
+import matplotlib
+from cartograph import Map
+from cartograph.style import AreaStyle, WayStyle, NameStyle, ElevationStyle
+from cartograph.stats import Stats
+from generate import BOUNDS, SIZES, random_ways, random_areas, random_names, random_elevation
+
+def timed(function, *args, **kwargs):
+    start = perf_counter()
+    result = function(*args, **kwargs)
+    return perf_counter() - start, result
+
+def ingest(n, seed):
+    '''
+    Measure the rate at which areas, ways and names are added to a map, both in bulk and one at a time (for at most 2000 features). Returns the rates in features per second and the map with the features added in bulk.
+    '''
+    rng = np.random.default_rng(seed)
+    areas = random_areas(rng, n)
+    ways = random_ways(rng, n)
+    names = random_names(rng, n)
+    area_style = AreaStyle(color='green')
+    way_style = WayStyle(color='blue')
+    name_style = NameStyle(fontsize=5, appears_at=12)
+
+    map = Map()
+    map.bound_by_osm_tiles(10, BOUNDS[:,0], BOUNDS[:,1])
+    rates = {}
+    rates['add_areas'] = n / timed(map.add_areas, *areas, area_style)[0]
+    rates['add_ways'] = n / timed(map.add_ways, *ways, way_style)[0]
+    rates['add_names'] = n / timed(map.add_names, *names, name_style)[0]
+
+    single = Map()
+    single.bound_by_osm_tiles(10, BOUNDS[:,0], BOUNDS[:,1])
+    m = min(n, 2000)
+    (boundaries, offsets), (vertices, way_offsets), (labels, locations) = areas, ways, names
+    rates['add_area'] = m / timed(lambda: [single.add_area(boundaries[:,offsets[i]:offsets[i+1]], area_style) for i in range(m)])[0]
+    rates['add_way'] = m / timed(lambda: [single.add_way(vertices[:,way_offsets[i]:way_offsets[i+1]], way_style) for i in range(m)])[0]
+    rates['add_name'] = m / timed(lambda: [single.add_name(labels[i], locations[:,i], name_style) for i in range(m)])[0]
+    return rates, map
+
+def run_case(size, zooms, seed):
+    '''
+    Run the benchmark for one map *size* (see :data:`SIZES`) and return the results as a dictionary.
+    '''
+    n = SIZES[size]
+    result = {'size':size, 'features':n}
+    result['ingest_per_second'], map = ingest(n, seed)
+
+    rng = np.random.default_rng(seed + 1)
+    elevation = random_elevation(rng, n)
+    result['add_elevation_seconds'] = timed(map.add_elevation, elevation, ElevationStyle(vmin=0, vmax=200, contour_levels=np.arange(0, 200, 20), contour_appears_at=13))[0]
+
+    def plot():
+        map.create_figure(1, 1)
+        map.plot()
+    result['plot_seconds'] = timed(plot)[0]
+
+    result['zooms'] = []
+    for zoom in zooms:
+        with TemporaryDirectory() as directory:
+            stats = Stats()
+            seconds, summary = timed(map.draw_zoom_levels, zoom, directory=directory, stats=stats)
+        stages = stats.summary()['stages']
+        render_seconds = sum(stages.values()) # excludes plotting the map again at the start of drawing
+        result['zooms'].append({'zoom':zoom, 'tiles':summary['tiles'], 'seconds':seconds, 'render_seconds':render_seconds, 'stages':stages, 'tiles_per_second':summary['tiles'] / render_seconds if render_seconds > 0 else 0.0})
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = rss / 2**20 if platform.system() == 'Darwin' else rss / 1024 # bytes on macOS, kilobytes on Linux
+    return result
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark cartograph on synthetic maps.')
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--zooms', nargs='+', type=int, default=[10, 12, 14])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--case', choices=list(SIZES), help='run a single size in this process and print the result')
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args.zooms, args.seed)))
+    else:
+        results = {'commit':commit(), 'python':platform.python_version(), 'numpy':np.__version__, 'matplotlib':matplotlib.__version__, 'platform':platform.platform(), 'seed':args.seed, 'cases':[]}
+        for size in args.sizes:
+            command = [executable, argv[0], '--case', size, '--seed', str(args.seed), '--zooms'] + [str(zoom) for zoom in args.zooms]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            case = json.loads(output.strip().split('\n')[-1])
+            print('%s: plot %.2f s, %s tiles/s, peak %.0f MB' % (size, case['plot_seconds'], ', '.join('z%d %.1f' % (zoom['zoom'], zoom['tiles_per_second']) for zoom in case['zooms']), case['peak_rss_mb']))
+            results['cases'].append(case)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Bounds of the synthetic maps in degrees of latitude / longitude
+BOUNDS = np.array([[51.45, 51.55], [-0.2, 0.0]])
+
+SIZES = {'small':1000, 'medium':10000, 'large':50000}
+
+def random_walks(rng, n, length, step, bounds=BOUNDS):
+    '''
+    Generate *n* random walks of *length* vertices with steps of about *step* degrees starting within *bounds*. Returns the (2,n*length) numpy array of lat/lon vertices and the offsets of each walk.
+    '''
+    start = rng.uniform(bounds[:,0], bounds[:,1], size=(n, 2)).T
+    steps = rng.normal(0, step, size=(2, n, length))
+    steps[:,:,0] = 0
+    vertices = start[:,:,np.newaxis] + np.cumsum(steps, axis=2)
+    return vertices.reshape(2, -1), np.arange(n + 1) * length
+
+def random_ways(rng, n, bounds=BOUNDS):
+    '''
+    Generate *n* ways of 20 vertices within *bounds*, as for :meth:`.Map.add_ways`.
+    '''
+    return random_walks(rng, n, 20, 0.0005, bounds)
+
+def random_areas(rng, n, bounds=BOUNDS):
+    '''
+    Generate *n* closed areas of 12 vertices within *bounds*, as for :meth:`.Map.add_areas`. Each area is a polygon around a random centre with a random radius.
+    '''
+    centre = rng.uniform(bounds[:,0], bounds[:,1], size=(n, 2)).T
+    radius = rng.uniform(0.0002, 0.002, size=(n, 12))
+    angle = np.linspace(0, 2*np.pi, 12)
+    radius[:,-1] = radius[:,0]
+    boundaries = centre[:,:,np.newaxis] + radius * np.array([np.sin(angle), np.cos(angle)])[:,np.newaxis,:]
+    return boundaries.reshape(2, -1), np.arange(n + 1) * 12
+
+def random_names(rng, n, bounds=BOUNDS):
+    '''
+    Generate *n* names at random locations within *bounds*, as for :meth:`.Map.add_names`.
+    '''
+    locations = rng.uniform(bounds[:,0], bounds[:,1], size=(n, 2)).T
+    return ['Place %d' % i for i in range(n)], locations
+
+def random_elevation(rng, n, bounds=BOUNDS):
+    '''
+    Generate *n* scattered elevation points within *bounds* (with a margin) on a few random hills, as for :meth:`.Map.add_elevation`.
+    '''
+    margin = 0.1 * (bounds[:,1] - bounds[:,0])
+    data = np.zeros((3, n))
+    data[:2] = rng.uniform(bounds[:,0] - margin, bounds[:,1] + margin, size=(n, 2)).T
+    hills = rng.uniform(bounds[:,0], bounds[:,1], size=(8, 2))
+    for lat, lon in hills:
+        data[2] += 100 * np.exp(-((data[0] - lat)**2 + (data[1] - lon)**2) / 0.001)
+    return data
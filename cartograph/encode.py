@@ -0,0 +1,52 @@
+from io import BytesIO
+import numpy as np
+from PIL import Image, features
+
+class Encoder():
+    '''
+    Encodes RGBA numpy arrays of tile images into bytes using Pillow, without going through :meth:`matplotlib.figure.Figure.savefig`. The *format* can be 'png', 'webp' or 'jpeg' (WebP and JPEG depend on the Pillow build).
+
+    For PNG, *compress_level* is the zlib compression level from 0 (fastest) to 9 (smallest) and if *quantize* is True the image is reduced to an 8-bit palette of at most *colors* colours. This makes tiles with gradients such as shaded relief much smaller but can make tiles of a few flat colours larger, so it is worth comparing on the map being drawn. For WebP and JPEG, *quality* is the quality from 0 to 100 and WebP can be *lossless*. JPEG does not support transparency so transparent pixels are drawn on a white background.
+    '''
+    def __init__(self, format='png', compress_level=6, quantize=False, colors=256, quality=90, lossless=False):
+        if format not in ('png', 'webp', 'jpeg'):
+            raise ValueError('Unknown tile format %s' % format)
+        if format != 'png' and not features.check(format if format == 'webp' else 'jpg'):
+            raise ValueError('Pillow was built without %s support' % format)
+        self.format = format
+        self.compress_level = compress_level
+        self.quantize = quantize
+        self.colors = colors
+        self.quality = quality
+        self.lossless = lossless
+
+    @property
+    def extension(self):
+        '''
+        The file extension used by :class:`.DirectorySink` for tiles in this format.
+        '''
+        return {'png':'.png.tile', 'webp':'.webp.tile', 'jpeg':'.jpg.tile'}[self.format]
+
+    def encode(self, image):
+        '''
+        Encode the (height, width, 4) RGBA numpy array *image* and return the bytes. A contiguous array, such as the canvas buffer of a single tile, is wrapped without copying.
+        '''
+        im = Image.fromarray(image, 'RGBA')
+        buffer = BytesIO()
+        if self.format == 'png':
+            if self.quantize:
+                im = im.quantize(self.colors, method=Image.Quantize.FASTOCTREE)
+            im.save(buffer, format='png', compress_level=self.compress_level)
+        elif self.format == 'webp':
+            im.save(buffer, format='webp', quality=self.quality, lossless=self.lossless)
+        else:
+            background = Image.new('RGB', im.size, 'white')
+            background.paste(im, mask=im)
+            background.save(buffer, format='jpeg', quality=self.quality)
+        return buffer.getvalue()
+
+    def decode(self, data):
+        '''
+        Decode the encoded image *data* and return it as a (height, width, 4) RGBA numpy array.
+        '''
+        return np.asarray(Image.open(BytesIO(data)).convert('RGBA'))
@@ -1,6 +1,18 @@
+from hashlib import sha1
+from collections import OrderedDict
+from os import stat, makedirs, replace
+from os.path import basename, join, exists
 import numpy as np
 from scipy.interpolate import griddata
-from matplotlib.colors import LightSource
+from scipy.ndimage import map_coordinates
+from matplotlib import rcParams
+from matplotlib.colors import LightSource, Normalize
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import LineCollection, PolyCollection
+from .simplify import douglas_peucker
+from .style import style_fingerprint
+from .projection import inverse_mercator
+from .index import GridIndex
 
 class Feature():
     '''
@@ -9,6 +21,13 @@ class Feature():
     def __init__(self, style):
         self.style = style
         self.artists = []
+        self.simplified = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['artists'] = []
+        state['simplified'] = None
+        return state
 
     def plot(self, axes):
         '''
@@ -16,6 +35,22 @@ class Feature():
         '''
         pass
 
+    def fingerprint(self, *data):
+        '''
+        Return a hash (bytes) of the type and style of the feature (see :func:`.style_fingerprint`) and any numpy arrays or strings in *data*. Subclasses override this method to pass their own data. The fingerprints are used to find which tiles have changed since they were last drawn.
+        '''
+        h = sha1(type(self).__name__.encode())
+        h.update(style_fingerprint(self.style))
+        for d in data:
+            h.update(d.encode() if isinstance(d, str) else np.ascontiguousarray(d).tobytes())
+        return h.digest()
+
+    def simplify(self, tolerance):
+        '''
+        Replace the plotted geometry with a version simplified to within *tolerance* (in projected coordinates). The method should be overridden by subclasses. By default it does nothing.
+        '''
+        pass
+
     def set_visible(self, visible):
         '''
         Make the feature visible or not (after it has been plotted).
@@ -49,12 +84,33 @@ class Area(Feature):
         has_intersection = np.any(np.logical_and(x_inbounds, y_inbounds))
         return has_intersection
 
+    def get_bbox(self):
+        '''
+        Return the bounding box of the boundary as a numpy array of the minimum x, maximum x, minimum y and maximum y coordinates.
+        '''
+        return np.array([self.boundary[0].min(), self.boundary[0].max(), self.boundary[1].min(), self.boundary[1].max()])
+
+    def fingerprint(self):
+        '''
+        Return a hash of the style and boundary of the area.
+        '''
+        return super().fingerprint(self.boundary)
+
     def plot(self, axes):
         '''
         Plot the area on *axes*.
         '''
         self.artists = axes.fill(self.boundary[0], self.boundary[1], clip_on=True, lw=0, color=self.style.color, fill=self.style.fill, hatch=self.style.hatch)
 
+    def simplify(self, tolerance):
+        '''
+        Replace the plotted boundary with the boundary simplified to within *tolerance* (in projected coordinates) by :func:`.douglas_peucker`. The simplified boundary is computed once and kept until the *tolerance* changes.
+        '''
+        if self.simplified is None or self.simplified[0] != tolerance:
+            self.simplified = (tolerance, douglas_peucker(self.boundary, tolerance))
+        for artist in self.artists:
+            artist.set_xy(self.simplified[1].T)
+
 class Way(Feature):
     '''
     Subclass of :class:`Feature`
@@ -74,12 +130,148 @@ class Way(Feature):
         has_intersection = np.any(np.logical_and(x_inbounds, y_inbounds))
         return has_intersection
 
+    def get_bbox(self):
+        '''
+        Return the bounding box of the vertices as a numpy array of the minimum x, maximum x, minimum y and maximum y coordinates.
+        '''
+        return np.array([self.vertices[0].min(), self.vertices[0].max(), self.vertices[1].min(), self.vertices[1].max()])
+
+    def fingerprint(self):
+        '''
+        Return a hash of the style and vertices of the way.
+        '''
+        return super().fingerprint(self.vertices)
+
     def plot(self, axes):
         '''
         Plot the way on *axes*.
         '''
         self.artists = axes.plot(self.vertices[0], self.vertices[1], clip_on=True, color=self.style.color, linestyle=self.style.linestyle, linewidth=self.style.linewidth, marker=self.style.markerstyle, markersize=self.style.markersize)
 
+    def simplify(self, tolerance):
+        '''
+        Replace the plotted vertices with the way simplified to within *tolerance* (in projected coordinates) by :func:`.douglas_peucker`. The simplified vertices are computed once and kept until the *tolerance* changes.
+        '''
+        if self.simplified is None or self.simplified[0] != tolerance:
+            self.simplified = (tolerance, douglas_peucker(self.vertices, tolerance))
+        for artist in self.artists:
+            artist.set_data(self.simplified[1][0], self.simplified[1][1])
+
+class Collection(Feature):
+    '''
+    Subclass of :class:`Feature`
+
+    Generic collection of shapes sharing one style, drawn as a single matplotlib collection rather than one artist per shape. The (2,M) numpy array *vertices* holds the vertices of every shape one after another and shape i is made up of the columns *offsets*\\ [i] to *offsets*\\ [i+1]. Only the shapes passed to :meth:`show` are drawn.
+    '''
+    def __init__(self, vertices, offsets, style):
+        super().__init__(style)
+        self.vertices = vertices
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.shown = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['shown'] = None
+        return state
+
+    def get_shape(self, i):
+        '''
+        Return the vertices of shape *i* as a (2,N) numpy array.
+        '''
+        return self.vertices[:,self.offsets[i]:self.offsets[i+1]]
+
+    def get_bboxes(self):
+        '''
+        Return the bounding boxes of the shapes as a (4,N) numpy array of the minimum x, maximum x, minimum y and maximum y coordinates.
+        '''
+        starts = self.offsets[:-1]
+        return np.array([np.minimum.reduceat(self.vertices[0], starts), np.maximum.reduceat(self.vertices[0], starts), np.minimum.reduceat(self.vertices[1], starts), np.maximum.reduceat(self.vertices[1], starts)])
+
+    def get_paths(self, indices, tolerance=None):
+        '''
+        Return a list of the vertices of the shapes with *indices*, as (N,2) numpy arrays. If *tolerance* is given the shapes are simplified by :func:`.douglas_peucker`, and the simplified shapes are kept until the *tolerance* changes.
+        '''
+        if tolerance is None:
+            return [self.get_shape(i).T for i in indices]
+        if self.simplified is None or self.simplified[0] != tolerance:
+            self.simplified = (tolerance, {})
+        cache = self.simplified[1]
+        paths = []
+        for i in indices:
+            if i not in cache:
+                cache[i] = douglas_peucker(self.get_shape(i), tolerance).T
+            paths.append(cache[i])
+        return paths
+
+    def set_paths(self, paths):
+        '''
+        Replace the plotted shapes with *paths*. The method should be overridden by subclasses.
+        '''
+        raise NotImplementedError
+
+    def show(self, indices, tolerance=None):
+        '''
+        Draw only the shapes with *indices*, simplified to within *tolerance* if it is given (see :meth:`get_paths`). The collection is hidden if *indices* is empty. The collection must have been plotted first.
+        '''
+        indices = [int(i) for i in indices]
+        if len(indices) == 0:
+            self.set_visible(False)
+            self.shown = None
+            return
+        if (indices, tolerance) != self.shown:
+            self.set_paths(self.get_paths(indices, tolerance))
+            self.shown = (indices, tolerance)
+        self.set_visible(True)
+
+class AreaCollection(Collection):
+    '''
+    Subclass of :class:`Collection`
+
+    Collection of areas with :class:`.AreaStyle` *style*, drawn as one :class:`matplotlib.collections.PolyCollection`.
+    '''
+    def plot(self, axes):
+        '''
+        Plot the (empty) collection on *axes*, hidden until :meth:`show` is called.
+        '''
+        collection = PolyCollection([], closed=True, clip_on=True, linewidths=0, facecolors=self.style.color if self.style.fill else 'none', edgecolors=self.style.color, hatch=self.style.hatch or None)
+        axes.add_collection(collection, autolim=False)
+        collection.set_visible(False)
+        self.artists = [collection]
+        self.shown = None
+
+    def set_paths(self, paths):
+        '''
+        Replace the plotted boundaries with *paths*.
+        '''
+        for artist in self.artists:
+            artist.set_verts(paths)
+
+class WayCollection(Collection):
+    '''
+    Subclass of :class:`Collection`
+
+    Collection of ways with :class:`.WayStyle` *style*, drawn as one :class:`matplotlib.collections.LineCollection` with the same line caps and joins as :class:`Way`. Line collections do not have markers, so the *markerstyle* of the style is ignored.
+    '''
+    def plot(self, axes):
+        '''
+        Plot the (empty) collection on *axes*, hidden until :meth:`show` is called.
+        '''
+        collection = LineCollection([], clip_on=True, colors=self.style.color, linestyles=self.style.linestyle, linewidths=self.style.linewidth, capstyle=rcParams['lines.solid_capstyle'], joinstyle=rcParams['lines.solid_joinstyle'])
+        axes.add_collection(collection, autolim=False)
+        collection.set_visible(False)
+        self.artists = [collection]
+        self.shown = None
+
+    def set_paths(self, paths):
+        '''
+        Replace the plotted ways with *paths*.
+        '''
+        for artist in self.artists:
+            artist.set_segments(paths)
+
 class Name(Feature):
     '''
     Subclass of :class:`Feature`
@@ -93,9 +285,21 @@ class Name(Feature):
 
     def is_inbounds(self, bounds):
         '''
-        Check whether the location is in *bounds*. Currently this method always returns True.
+        Check whether the location is in *bounds*.
+        '''
+        return bounds[0,0] <= self.location[0] <= bounds[0,1] and bounds[1,0] <= self.location[1] <= bounds[1,1]
+
+    def get_bbox(self):
+        '''
+        Return the bounding box of the location, which is just the location repeated.
+        '''
+        return np.array([self.location[0], self.location[0], self.location[1], self.location[1]])
+
+    def fingerprint(self):
+        '''
+        Return a hash of the style, name and location.
         '''
-        return True
+        return super().fingerprint(self.name, self.location)
 
     def plot(self, axes):
         '''
@@ -118,6 +322,8 @@ class Elevation(Feature):
     Subclass of :class:`Feature`
 
     Elevation feature with :class:`.ElevationStyle` *style*. The *data* is expected to be an (3,N) numpy array where each row gives an x-coordinate, y-coordinate and elevation.
+
+    By default the elevation is interpolated once on a grid covering the whole map, see :meth:`generate_elevation_grid`. If the elevation is tiled (see :meth:`set_tiled`), the grid is instead interpolated for each tile when it is needed at a resolution which depends on the zoom level, see :meth:`tile_grid`.
     '''
     def __init__(self, data, style):
         super().__init__(style)
@@ -126,20 +332,122 @@ class Elevation(Feature):
         self.grid_y = None
         self.ele = None
         self.im_extent = None
+        self.contours = None
+        self.labels = []
+        self.contour_lines = None
+        self.layer = None
+        self.layers = OrderedDict()
+        self.relief_cache = None
+        self.relief_image = None
+        self.relief_artist = None
 
-    def generate_elevation_grid(self, bounds, resolution=(100, 100), padding=1):
+        self.tiled = False
+        self.samples = 128
+        self.overlap = 4
+        self.cache_size = 64
+        self.cache = OrderedDict()
+        self.images = []
+        self.layer_cache_size = 8
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['contours'] = None
+        state['labels'] = []
+        state['cache'] = OrderedDict()
+        state['images'] = []
+        state['contour_lines'] = None
+        state['layer'] = None
+        state['layers'] = OrderedDict()
+        state['relief_artist'] = None
+        if self.relief_cache is not None:
+            state['relief_image'] = None
+        return state
+
+    def fingerprint(self):
         '''
-        Interpolate the elevation data on a regular grid given by *bounds* and *resolution*. *padding* is used to eliminate edge effects from interpolation.
+        Return a hash of the style and elevation data.
+        '''
+        return super().fingerprint(self.data)
+
+    def interpolate(self, grid_x, grid_y, padding=1):
         '''
-        mask0 = np.logical_and(bounds[0,0]-padding <= self.data[0], self.data[0] <= bounds[0,1]+padding)
-        mask1 = np.logical_and(bounds[1,0]-padding <= self.data[1], self.data[1] <= bounds[1,1]+padding)
+        Interpolate the elevation data at the points given by the numpy arrays *grid_x* and *grid_y*. Only the data within *padding* of the points is used, which also eliminates edge effects from interpolation.
+        '''
+        mask0 = np.logical_and(grid_x.min()-padding <= self.data[0], self.data[0] <= grid_x.max()+padding)
+        mask1 = np.logical_and(grid_y.min()-padding <= self.data[1], self.data[1] <= grid_y.max()+padding)
         mask = np.logical_and(mask0, mask1)
         masked_data = self.data[:,mask]
+        return griddata(masked_data[0:2].T, masked_data[2], (grid_x, grid_y), method='cubic')
 
+    def generate_elevation_grid(self, bounds, resolution=(100, 100), padding=1):
+        '''
+        Interpolate the elevation data on a regular grid given by *bounds* and *resolution*. *padding* is used to eliminate edge effects from interpolation.
+        '''
         self.grid_x, self.grid_y = np.mgrid[bounds[0,0]:bounds[0,1]:resolution[0]*1j, bounds[1,0]:bounds[1,1]:resolution[1]*1j]
-        self.ele = griddata(masked_data[0:2].T, masked_data[2], (self.grid_x, self.grid_y), method='cubic')
+        self.ele = self.interpolate(self.grid_x, self.grid_y, padding)
         self.im_extent = [self.grid_x[0,0], self.grid_x[-1,0], self.grid_y[0,0], self.grid_y[0,-1]]
 
+    def set_tiled(self, samples=128, cache_size=64):
+        '''
+        Interpolate the elevation for each tile when it is drawn rather than on one grid for the whole map. Each tile is sampled on a grid of *samples* by *samples* points, so the resolution doubles with each zoom level, and the grids of the last *cache_size* tiles are kept, see :meth:`tile_grid`. Only the grids of the tiles being drawn are in memory, so large regions can be drawn at high resolution.
+        '''
+        self.tiled = True
+        self.samples = samples
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def tile_grid(self, x, y, zoom, bounds):
+        '''
+        Returns the elevation grid of the tile given by *x*, *y* and *zoom* with projected *bounds*, as a numpy array indexed by x and then y. The grid points are the centres of :attr:`samples` by :attr:`samples` cells covering the tile and the grid extends :attr:`overlap` cells beyond the tile on each side, so that neighbouring tiles overlap and the hillshade and contours continue across the edges. The grids are cached and the least recently used grid is dropped when there are more than :attr:`cache_size`.
+        '''
+        key = (x, y, zoom)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        d = (bounds[0,1] - bounds[0,0]) / self.samples
+        cells = np.arange(-self.overlap, self.samples + self.overlap) + 0.5
+        grid_x, grid_y = np.meshgrid(bounds[0,0] + cells*d, bounds[1,0] + cells*d, indexing='ij')
+        self.cache[key] = self.interpolate(grid_x, grid_y)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.cache[key]
+
+    def shade(self, ele, spacing):
+        '''
+        Returns the hillshade of the grid *ele*, indexed by x and then y with points *spacing* metres apart (assuming the elevation is also in metres). Unlike :meth:`draw_hillshade`, the intensity is not rescaled to the range of the grid, so the hillshade of neighbouring tiles matches.
+        '''
+        ls = LightSource(azdeg=30, altdeg=60)
+        e_dx, e_dy = np.gradient(ele, spacing)
+        normal = np.stack([-e_dx, -e_dy, np.ones(ele.shape)], axis=-1)
+        normal /= np.sqrt(np.sum(normal**2, axis=-1, keepdims=True))
+        return np.clip(normal.dot(ls.direction), 0, 1)
+
+    def draw_window(self, axes, ele, bounds, contours=False):
+        '''
+        Draw the background image and hillshade of the tiled elevation grid *ele* within projected *bounds* on *axes*, replacing those drawn for the previous window. *ele* is made of the grids from :meth:`tile_grid` so extends :attr:`overlap` cells beyond *bounds*. If *contours* is True, labelled contours are drawn as well.
+        '''
+        p = self.overlap
+        nx, ny = ele.shape[0] - 2*p, ele.shape[1] - 2*p
+        d = (bounds[0,1] - bounds[0,0]) / nx
+        extent = [bounds[0,0], bounds[0,1], bounds[1,0], bounds[1,1]]
+        lat, lon = inverse_mercator(0, (bounds[1,0] + bounds[1,1]) / 2)
+        shade = self.shade(ele, 1000 * d * np.cos(np.deg2rad(lat)))[p:p+nx, p:p+ny]
+
+        if len(self.images) == 0:
+            self.images = [axes.imshow(ele[p:p+nx, p:p+ny].T, origin='lower', extent=extent, interpolation='bilinear', cmap=self.style.colormap, vmin=self.style.vmin, vmax=self.style.vmax, alpha=self.style.colormap_alpha),
+                           axes.imshow(shade.T, origin='lower', extent=extent, interpolation='bilinear', cmap='gray', vmin=0, vmax=1, alpha=self.style.hillshade_alpha)]
+        else:
+            for image, data in zip(self.images, [ele[p:p+nx, p:p+ny], shade]):
+                image.set_data(data.T)
+                image.set_extent(extent)
+
+        self.remove_contours()
+        if contours:
+            cells = np.arange(-p, max(nx, ny) + p) + 0.5
+            grid_x, grid_y = np.meshgrid(bounds[0,0] + cells[:nx+2*p]*d, bounds[1,0] + cells[:ny+2*p]*d, indexing='ij')
+            self.draw_contours(axes, grid_x, grid_y, ele)
+
     def draw_background_image(self, axes):
         '''
         Draw an image from the elevation data on *axes*. The :meth:`generate_elevation_grid` must be called before this method. The image is not automatically send to the back of the figure.
@@ -160,6 +468,74 @@ class Elevation(Feature):
             shade = ls.hillshade(self.ele, vert_exag=1, fraction=1.0).T
             axes.imshow(shade, origin='lower', extent=self.im_extent, interpolation='bilinear', cmap='gray', alpha=self.style.hillshade_alpha)
 
+    def blend_relief(self):
+        '''
+        Returns the background image and hillshade of the elevation grid blended into one RGBA image, as a numpy array of 8-bit integers with rows from south to north. The result looks the same as drawing :meth:`draw_background_image` and then :meth:`draw_hillshade`, but is a single image which can be cropped to each tile. The :meth:`generate_elevation_grid` must be called before this method.
+        '''
+        if self.ele is None:
+            raise TypeError('Elevation grid is not initialised, call generate_elevation_grid before this method')
+        colors = ScalarMappable(Normalize(self.style.vmin, self.style.vmax), self.style.colormap).to_rgba(self.ele.T)
+        colors[...,3] *= self.style.colormap_alpha
+
+        ls = LightSource(azdeg=30, altdeg=60)
+        shade = ls.hillshade(self.ele, vert_exag=1, fraction=1.0).T
+        shade = (shade - np.nanmin(shade)) / max(np.nanmax(shade) - np.nanmin(shade), 1e-12)
+        shade_alpha = np.where(np.isnan(shade), 0, self.style.hillshade_alpha)
+        shade = np.nan_to_num(shade)
+
+        alpha = shade_alpha + colors[...,3] * (1 - shade_alpha)
+        rgb = (shade[...,None] * shade_alpha[...,None] + colors[...,:3] * (colors[...,3] * (1 - shade_alpha))[...,None]) / np.maximum(alpha, 1e-12)[...,None]
+        return np.round(255 * np.concatenate([rgb, alpha[...,None]], axis=-1)).astype(np.uint8)
+
+    def relief(self):
+        '''
+        Returns the blended RGBA image from :meth:`blend_relief`, which is only computed once. If :attr:`relief_cache` is a directory, the image is saved there as a .npy file named by a hash of the elevation data, the style (see :func:`.style_fingerprint`) and the grid, and loaded as a memory-mapped array, so it is shared by parallel processes and later runs rather than computed again.
+        '''
+        if self.relief_image is not None:
+            return self.relief_image
+
+        if self.relief_cache is None:
+            self.relief_image = self.blend_relief()
+            return self.relief_image
+
+        h = sha1(self.fingerprint())
+        h.update(np.asarray(self.im_extent, dtype=float).tobytes())
+        h.update(np.asarray(self.ele.shape, dtype=np.int64).tobytes())
+        filename = join(self.relief_cache, 'relief-%s.npy' % h.hexdigest())
+        if not exists(filename):
+            makedirs(self.relief_cache, exist_ok=True)
+            np.save(filename + '.tmp.npy', self.blend_relief())
+            replace(filename + '.tmp.npy', filename)
+        self.relief_image = np.load(filename, mmap_mode='r')
+        return self.relief_image
+
+    def plot_relief(self, axes):
+        '''
+        Plot an (empty) image on *axes* for the shaded relief, which is drawn around each tile by :meth:`show_relief`.
+        '''
+        self.relief_artist = axes.imshow(np.zeros((1, 1, 4), dtype=np.uint8), origin='lower', extent=self.im_extent, interpolation='bilinear')
+        self.relief_artist.set_visible(False)
+        self.artists = [self.relief_artist]
+
+    def show_relief(self, bounds):
+        '''
+        Draw the part of the shaded relief from :meth:`relief` within *bounds*, given in projected coordinates, with a margin of one pixel for the interpolation. Only this window is resampled when the figure is drawn rather than the whole image.
+        '''
+        image = self.relief()
+        rows, columns = image.shape[:2]
+        dx = (self.im_extent[1] - self.im_extent[0]) / columns
+        dy = (self.im_extent[3] - self.im_extent[2]) / rows
+        c0 = int(np.clip(np.floor((bounds[0,0] - self.im_extent[0]) / dx) - 1, 0, columns))
+        c1 = int(np.clip(np.ceil((bounds[0,1] - self.im_extent[0]) / dx) + 1, 0, columns))
+        r0 = int(np.clip(np.floor((bounds[1,0] - self.im_extent[2]) / dy) - 1, 0, rows))
+        r1 = int(np.clip(np.ceil((bounds[1,1] - self.im_extent[2]) / dy) + 1, 0, rows))
+        if c1 <= c0 or r1 <= r0:
+            self.relief_artist.set_visible(False)
+            return
+        self.relief_artist.set_data(np.ascontiguousarray(image[r0:r1, c0:c1]))
+        self.relief_artist.set_extent([self.im_extent[0] + c0*dx, self.im_extent[0] + c1*dx, self.im_extent[2] + r0*dy, self.im_extent[2] + r1*dy])
+        self.relief_artist.set_visible(True)
+
     def plot_contours(self, axes):
         '''
         Draw labelled contours from the elevation data on *axes*. The :meth:`generate_elevation_grid` must be called before this method.
@@ -167,15 +543,236 @@ class Elevation(Feature):
         if self.ele is None:
             raise TypeError('Elevation grid is not initialised, call generate_elevation_grid before this method')
         else:
-            self.contours = axes.contour(self.grid_x, self.grid_y, self.ele, levels=self.style.contour_levels, colors=self.style.contour_color, linewidths=self.style.contour_width)
-            self.labels = axes.clabel(self.contours, self.style.clabel_levels, inline=1, inline_spacing=0.0, fontsize=self.style.clabel_fontsize, fmt='%0.0f', use_clabeltext=False)
-            self.artists = self.contours.collections + self.labels
+            self.draw_contours(axes, self.grid_x, self.grid_y, self.ele)
+
+    def draw_contours(self, axes, grid_x, grid_y, ele):
+        '''
+        Draw labelled contours of the elevation grid *ele* at the points *grid_x* and *grid_y* on *axes*.
+        '''
+        self.contours = axes.contour(grid_x, grid_y, ele, levels=self.style.contour_levels, colors=self.style.contour_color, linewidths=self.style.contour_width)
+        self.labels = axes.clabel(self.contours, self.style.clabel_levels, inline=1, inline_spacing=0.0, fontsize=self.style.clabel_fontsize, fmt='%0.0f', use_clabeltext=False)
+        self.artists = self.contours.collections + self.labels
+
+    def contour_geometry(self, axes):
+        '''
+        Returns the contour lines of the elevation grid as a list of tuples of the level and a (2,N) numpy array of the vertices of the line. The lines are computed on *axes* the first time and kept, since the grid is the same at every zoom level. The :meth:`generate_elevation_grid` must be called before this method.
+        '''
+        if self.contour_lines is None:
+            if self.ele is None:
+                raise TypeError('Elevation grid is not initialised, call generate_elevation_grid before this method')
+            contours = axes.contour(self.grid_x, self.grid_y, self.ele, levels=self.style.contour_levels)
+            self.contour_lines = [(level, segment.T) for level, segments in zip(contours.levels, contours.allsegs) for segment in segments if len(segment) > 1]
+            for c in contours.collections:
+                c.remove()
+        return self.contour_lines
+
+    def plot_contour_layer(self, axes, pixel):
+        '''
+        Plot the contours for a zoom level where a pixel is *pixel* wide in projected coordinates as a :class:`ContourLayer`, which draws only the contours near each tile. The lines from :meth:`contour_geometry` are simplified to within half a pixel and the labels are placed along them, see :meth:`ContourLayer.place_labels`. Any contours already plotted are removed.
+
+        The layers of the last :attr:`layer_cache_size` zoom levels are kept, so switching back and forth between zoom levels, e.g. when serving tiles on demand, does not place the labels and simplify the lines again.
+        '''
+        self.remove_contours()
+        self.layer = self.layers.pop(pixel, None)
+        if self.layer is None:
+            label_levels = set(self.style.clabel_levels.tolist())
+            fontsize = self.style.clabel_fontsize * 256 / 72
+            lines = []
+            labels = []
+            for level, line in self.contour_geometry(axes):
+                text = '%0.0f' % level
+                if level in label_levels:
+                    pieces, placed = ContourLayer.place_labels(line, 0.6 * fontsize * len(text) * pixel, 512 * pixel)
+                    labels += [(x, y, angle, text) for x, y, angle in placed]
+                else:
+                    pieces = [line]
+                lines += [douglas_peucker(piece, pixel / 2) for piece in pieces]
+            self.layer = ContourLayer(lines, labels, self.style)
+        self.layers[pixel] = self.layer
+        if len(self.layers) > self.layer_cache_size:
+            self.layers.popitem(last=False)
+        self.layer.plot(axes)
+        self.artists = self.layer.artists
 
     def remove_contours(self):
         '''
-        Remove contours and labels.
+        Remove contours and labels. Does nothing if the contours have not been plotted.
         '''
+        if self.layer is not None:
+            self.layer.remove()
+            self.layer = None
+            self.artists = []
+        if self.contours is None:
+            return
         for c in self.contours.collections:
             c.remove()
         for l in self.labels:
             l.remove()
+        self.contours = None
+        self.labels = []
+        self.artists = []
+
+class ContourLayer(Feature):
+    '''
+    Subclass of :class:`Feature`
+
+    Contours of an :class:`Elevation` at one zoom level with :class:`.ElevationStyle` *style*. The *lines* are a list of (2,N) numpy arrays and the *labels* a list of (x, y, angle, text) tuples. The lines and labels are indexed spatially so that :meth:`show` only draws those near each tile, with one :class:`matplotlib.collections.LineCollection` for the lines and a text artist for each label which is shown.
+    '''
+    def __init__(self, lines, labels, style):
+        super().__init__(style)
+        self.lines = lines
+        self.labels = labels
+        self.line_index = GridIndex(np.array([[line[0].min(), line[0].max(), line[1].min(), line[1].max()] for line in lines]).T)
+        self.label_index = GridIndex(np.array([[x, x, y, y] for x, y, angle, text in labels]).T)
+        self.collection = None
+        self.texts = {}
+
+    @staticmethod
+    def place_labels(line, width, spacing):
+        '''
+        Place labels of *width* along the (2,N) numpy array *line*, one for every *spacing* along the line, and cut a gap for each label out of the line. Lines shorter than three labels are not labelled. Returns a list of the pieces of the line and a list of (x, y, angle) tuples of the centre and angle in degrees of each label.
+        '''
+        arc = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(line, axis=1)))])
+        length = arc[-1]
+        if length < 3 * width:
+            return [line], []
+
+        def point(t):
+            return np.array([np.interp(t, arc, line[0]), np.interp(t, arc, line[1])])
+
+        n = max(1, int(length // spacing))
+        centres = (np.arange(n) + 0.5) * length / n
+        cuts = np.concatenate([[0], np.ravel(np.array([centres - width/2, centres + width/2]).T), [length]]).reshape(-1, 2)
+        pieces = [np.concatenate([point(a)[:,None], line[:,np.logical_and(a < arc, arc < b)], point(b)[:,None]], axis=1) for a, b in cuts]
+
+        placed = []
+        for centre in centres:
+            dx, dy = point(centre + width/2) - point(centre - width/2)
+            angle = np.rad2deg(np.arctan2(dy, dx))
+            if angle > 90:
+                angle -= 180
+            elif angle <= -90:
+                angle += 180
+            x, y = point(centre)
+            placed.append((x, y, angle))
+        return pieces, placed
+
+    def plot(self, axes):
+        '''
+        Plot the (empty) line collection on *axes*. The lines and labels are drawn by :meth:`show`.
+        '''
+        self.axes = axes
+        self.collection = LineCollection([], clip_on=True, colors=self.style.contour_color, linewidths=self.style.contour_width)
+        axes.add_collection(self.collection, autolim=False)
+        self.artists = [self.collection]
+
+    def show(self, bounds):
+        '''
+        Draw only the lines which intersect *bounds*, given in projected coordinates, and the labels within a tenth of the width of *bounds* of it.
+        '''
+        self.collection.set_segments([self.lines[i].T for i in self.line_index.query(bounds)])
+        width = bounds[0,1] - bounds[0,0]
+        visible = set(self.label_index.query(bounds + np.array([[-width/10, width/10], [-width/10, width/10]])).tolist())
+        for i in set(self.texts) - visible:
+            self.texts.pop(i).remove()
+        for i in visible - set(self.texts):
+            x, y, angle, text = self.labels[i]
+            self.texts[i] = self.axes.text(x, y, text, rotation=angle, rotation_mode='anchor', ha='center', va='center', clip_on=True, color=self.style.contour_color, fontsize=self.style.clabel_fontsize)
+
+    def remove(self):
+        '''
+        Remove the lines and labels from the plot.
+        '''
+        for text in self.texts.values():
+            text.remove()
+        self.texts = {}
+        if self.collection is not None:
+            self.collection.remove()
+            self.collection = None
+        self.artists = []
+
+class DEMElevation(Elevation):
+    '''
+    Subclass of :class:`Elevation`
+
+    Elevation feature from a regular grid of elevations (a digital elevation model) with :class:`.ElevationStyle` *style*. The *source* can be the filename of an `SRTM <https://www2.jpl.nasa.gov/srtm/>`_ .hgt file, the filename of a .npy file or a 2D numpy array. Files are memory-mapped, so only the part of the grid that is needed is read, rather than interpolating scattered points as :class:`Elevation` does.
+
+    The rows of the grid go from north to south and the columns from west to east. *extent* gives the latitudes of the first and last rows and the longitudes of the first and last columns as (south, north, west, east). For .hgt files the extent is read from the file name (e.g. N51W001.hgt) if it is not given. Voids in .hgt files are treated as missing data.
+
+    The grid is resampled with spline interpolation of order *order* (1 is bilinear) by :func:`scipy.ndimage.map_coordinates`. The projected coordinates are converted back to lat/lon with :func:`.inverse_mercator`, so the map must use the default projection.
+    '''
+    def __init__(self, source, style, extent=None, order=1):
+        super().__init__(None, style)
+        self.source = source
+        self.order = order
+        self.hash = None
+        if isinstance(source, str) and source.lower().endswith('.hgt') and extent is None:
+            name = basename(source).upper()
+            lat = int(name[1:3]) * (1 if name[0] == 'N' else -1)
+            lon = int(name[4:7]) * (1 if name[3] == 'E' else -1)
+            extent = (lat, lat + 1, lon, lon + 1)
+        if extent is None:
+            raise ValueError('The extent of the elevation grid must be given')
+        self.extent = tuple(float(e) for e in extent)
+        self.dem = self.load()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        if isinstance(self.source, str):
+            state['dem'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.dem is None:
+            self.dem = self.load()
+
+    def load(self):
+        '''
+        Return the elevation grid of the source, memory-mapped if the source is a file.
+        '''
+        if not isinstance(self.source, str):
+            return np.asarray(self.source)
+        if self.source.lower().endswith('.hgt'):
+            size = int(round(np.sqrt(stat(self.source).st_size / 2)))
+            return np.memmap(self.source, dtype='>i2', mode='r', shape=(size, size))
+        return np.load(self.source, mmap_mode='r')
+
+    def fingerprint(self):
+        '''
+        Return a hash of the style, extent and source of the elevation data. Files are identified by their name, size and modification time rather than their contents.
+        '''
+        if self.hash is None:
+            if isinstance(self.source, str):
+                info = stat(self.source)
+                source = '%s %d %d' % (self.source, info.st_size, info.st_mtime_ns)
+            else:
+                source = sha1(np.ascontiguousarray(self.dem).tobytes()).hexdigest()
+            self.hash = Feature.fingerprint(self, repr((self.extent, self.order)), source)
+        return self.hash
+
+    def sample(self, lat, lon):
+        '''
+        Interpolate the elevation at the numpy arrays *lat* and *lon*, reading only the window of the grid around them. Points outside the grid are NaN.
+        '''
+        south, north, west, east = self.extent
+        rows, columns = self.dem.shape
+        row = (north - lat) / (north - south) * (rows - 1)
+        column = (lon - west) / (east - west) * (columns - 1)
+
+        r0 = int(np.clip(np.floor(np.nanmin(row)) - self.order, 0, rows - 1))
+        r1 = int(np.clip(np.ceil(np.nanmax(row)) + self.order + 1, r0 + 1, rows))
+        c0 = int(np.clip(np.floor(np.nanmin(column)) - self.order, 0, columns - 1))
+        c1 = int(np.clip(np.ceil(np.nanmax(column)) + self.order + 1, c0 + 1, columns))
+        window = np.array(self.dem[r0:r1, c0:c1], dtype=float)
+        if self.dem.dtype == np.dtype('>i2'):
+            window[window == -32768] = np.nan
+
+        return map_coordinates(window, [row - r0, column - c0], order=self.order, mode='constant', cval=np.nan)
+
+    def interpolate(self, grid_x, grid_y, padding=1):
+        '''
+        Resample the elevation grid at the points given by the numpy arrays *grid_x* and *grid_y* in projected coordinates. *padding* is not needed since the grid is interpolated locally and is ignored.
+        '''
+        lat, lon = inverse_mercator(grid_x, grid_y)
+        return self.sample(lat, lon)
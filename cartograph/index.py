@@ -0,0 +1,100 @@
+import numpy as np
+
+class GridIndex():
+    '''
+    Spatial index of bounding boxes on a uniform grid. The *bboxes* are given as a (4,N) numpy array where the rows are the minimum x, maximum x, minimum y and maximum y coordinates of each item. By default the grid has roughly one cell per item. Items which cover more than *max_cells* cells are stored in :attr:`coarse`, a grid over the same *extent* with a quarter as many cells along each side, and so on, so large items such as coastlines are still only checked by queries near them.
+    '''
+    def __init__(self, bboxes, cells=None, max_cells=16, extent=None):
+        self.bboxes = np.asarray(bboxes, dtype=float).reshape(4, -1)
+        n_items = self.bboxes.shape[1]
+        if cells is None:
+            cells = int(np.ceil(np.sqrt(n_items)))
+        self.cells = max(cells, 1)
+
+        if extent is not None:
+            self.extent = np.asarray(extent, dtype=float)
+        elif n_items > 0:
+            self.extent = np.array([self.bboxes[0].min(), self.bboxes[1].max(), self.bboxes[2].min(), self.bboxes[3].max()])
+        else:
+            self.extent = np.array([0.0, 1.0, 0.0, 1.0])
+        self.cell_size = np.array([self.extent[1] - self.extent[0], self.extent[3] - self.extent[2]]) / self.cells
+        self.cell_size[self.cell_size <= 0] = 1.0
+
+        i0, i1 = self._cell_range(self.bboxes[0], self.bboxes[1], 0)
+        j0, j1 = self._cell_range(self.bboxes[2], self.bboxes[3], 1)
+        n_cells = (i1 - i0 + 1) * (j1 - j0 + 1)
+        large = n_cells > max_cells
+        self.large = np.flatnonzero(large)
+        self.coarse = None
+        if len(self.large) > 0:
+            self.coarse = GridIndex(self.bboxes[:,self.large], max(self.cells // 4, 1), max_cells, self.extent)
+
+        small = np.flatnonzero(np.logical_not(large))
+        counts = n_cells[small]
+        items = np.repeat(small, counts)
+        k = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = (j1 - j0 + 1)[items]
+        cell = (i0[items] + k // width) * self.cells + j0[items] + k % width
+
+        order = np.argsort(cell, kind='stable')
+        self.items = items[order]
+        self.cell_start = np.searchsorted(cell[order], np.arange(self.cells**2 + 1))
+
+    def __len__(self):
+        return self.bboxes.shape[1]
+
+    def _cell_range(self, lower, upper, axis):
+        start = np.floor((lower - self.extent[2*axis]) / self.cell_size[axis]).astype(int)
+        stop = np.floor((upper - self.extent[2*axis]) / self.cell_size[axis]).astype(int)
+        return np.clip(start, 0, self.cells-1), np.clip(stop, 0, self.cells-1)
+
+    def query(self, bounds):
+        '''
+        Return the sorted indices of the items whose bounding boxes intersect *bounds*, given as a (2,2) numpy array of x and y bounds in the same way as :attr:`.Map.bounds`.
+        '''
+        if len(self) == 0 or bounds[0,1] < self.extent[0] or bounds[0,0] > self.extent[1] or bounds[1,1] < self.extent[2] or bounds[1,0] > self.extent[3]:
+            return self.large[:0]
+
+        i0, i1 = self._cell_range(np.array([bounds[0,0]]), np.array([bounds[0,1]]), 0)
+        j0, j1 = self._cell_range(np.array([bounds[1,0]]), np.array([bounds[1,1]]), 1)
+        candidates = [self.large[:0]]
+        for i in range(i0[0], i1[0]+1):
+            candidates.append(self.items[self.cell_start[i*self.cells + j0[0]]:self.cell_start[i*self.cells + j1[0] + 1]])
+        candidates = np.unique(np.concatenate(candidates))
+
+        bboxes = self.bboxes[:,candidates]
+        mask = np.logical_and(np.logical_and(bboxes[0] <= bounds[0,1], bounds[0,0] <= bboxes[1]), np.logical_and(bboxes[2] <= bounds[1,1], bounds[1,0] <= bboxes[3]))
+        if self.coarse is None:
+            return candidates[mask]
+        return np.sort(np.concatenate([candidates[mask], self.large[self.coarse.query(bounds)]]))
+
+class CollisionGrid():
+    '''
+    Spatial hash of boxes which must not overlap, used to place labels. Each box is stored in every cell of size *cell_size* that it covers, so checking a new box only compares it with the boxes in the cells it covers. Boxes are given as tuples of the minimum x, maximum x, minimum y and maximum y coordinates.
+    '''
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = []
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def place(self, box):
+        '''
+        Add *box* if it does not overlap any box already placed. Returns True if the box was added.
+        '''
+        x0, x1, y0, y1 = box
+        i0, i1 = int(np.floor(x0 / self.cell_size)), int(np.floor(x1 / self.cell_size))
+        j0, j1 = int(np.floor(y0 / self.cell_size)), int(np.floor(y1 / self.cell_size))
+        cells = [(i, j) for i in range(i0, i1+1) for j in range(j0, j1+1)]
+        for cell in cells:
+            for k in self.cells.get(cell, ()):
+                b = self.boxes[k]
+                if x0 <= b[1] and b[0] <= x1 and y0 <= b[3] and b[2] <= y1:
+                    return False
+
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(len(self.boxes))
+        self.boxes.append(box)
+        return True
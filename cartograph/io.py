@@ -0,0 +1,190 @@
+from xml.etree.ElementTree import iterparse
+from array import array
+import numpy as np
+from .style import AreaStyle, WayStyle, NameStyle, NodeStyle
+
+class NodeIndex():
+    '''
+    Compact index from OpenStreetMap node ids to lat/lon coordinates. The ids and coordinates are appended to typed arrays as the nodes are read and are sorted into numpy arrays the first time they are looked up, so each node takes 24 bytes rather than a Python object. *bounds* is a (2,2) numpy array of lat/lon bounds as returned by :meth:`.Map.get_latlon_bounds` and is used to record which nodes are within the map.
+    '''
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.new_ids = array('q')
+        self.new_coords = array('d')
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.coords = np.zeros((2,0))
+        self.inbounds = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids) + len(self.new_ids)
+
+    def append(self, id, lat, lon):
+        '''
+        Add the node *id* with coordinates *lat* and *lon*.
+        '''
+        self.new_ids.append(id)
+        self.new_coords.append(lat)
+        self.new_coords.append(lon)
+
+    def sort(self):
+        '''
+        Sort the nodes added since the last lookup into the index.
+        '''
+        if len(self.new_ids) == 0:
+            return
+        ids = np.concatenate([self.ids, np.frombuffer(self.new_ids, dtype=np.int64)])
+        coords = np.concatenate([self.coords, np.frombuffer(self.new_coords, dtype=float).reshape(-1, 2).T], axis=1)
+        self.new_ids = array('q')
+        self.new_coords = array('d')
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.coords = coords[:,order]
+        self.inbounds = np.logical_and(np.logical_and(self.bounds[0,0] <= self.coords[0], self.coords[0] <= self.bounds[0,1]), np.logical_and(self.bounds[1,0] <= self.coords[1], self.coords[1] <= self.bounds[1,1]))
+
+    def lookup(self, ids):
+        '''
+        Find the nodes with *ids*. Returns the positions of the nodes in the index and a boolean array of which ids were found.
+        '''
+        self.sort()
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, ids), np.maximum(len(self.ids) - 1, 0))
+        found = self.ids[positions] == ids if len(self.ids) > 0 else np.zeros(len(ids), dtype=bool)
+        return positions, found
+
+def match(tags, rules, types):
+    '''
+    Returns the style of the first rule in *rules* which matches the dictionary *tags* and whose style is an instance of *types*, or None. Each rule is a tuple of a tag key, a tag value and a style, where a value of None matches any value of the key.
+    '''
+    for key, value, style in rules:
+        if key in tags and (value is None or tags[key] == value) and isinstance(style, types):
+            return style
+    return None
+
+class ShapeBuffer():
+    '''
+    Buffer of the node references and styles of the ways or areas read by :func:`load_osm`, which are added to the map in batches.
+    '''
+    def __init__(self):
+        self.refs = array('q')
+        self.counts = array('q')
+        self.style_ids = array('q')
+        self.styles = []
+        self.style_numbers = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def append(self, refs, style):
+        '''
+        Add a shape with the node ids *refs* and *style*.
+        '''
+        if id(style) not in self.style_numbers:
+            self.style_numbers[id(style)] = len(self.styles)
+            self.styles.append(style)
+        self.refs.extend(refs)
+        self.counts.append(len(refs))
+        self.style_ids.append(self.style_numbers[id(style)])
+
+    def flush(self, nodes, add):
+        '''
+        Resolve the node ids of the buffered shapes with the :class:`NodeIndex` *nodes* and pass the shapes which have a node within the map bounds to *add*, i.e. :meth:`.Map.add_ways` or :meth:`.Map.add_areas`. Missing nodes are left out of the shapes. Returns the number of shapes added.
+        '''
+        if len(self) == 0:
+            return 0
+        positions, found = nodes.lookup(np.frombuffer(self.refs, dtype=np.int64))
+        counts = np.frombuffer(self.counts, dtype=np.int64)
+        shape = np.repeat(np.arange(len(counts)), counts)
+        inbounds = np.zeros(len(counts), dtype=bool)
+        inbounds[shape[np.logical_and(found, nodes.inbounds[positions] if len(nodes) > 0 else False)]] = True
+
+        keep = np.logical_and(found, inbounds[shape])
+        counts = np.bincount(shape[keep], minlength=len(counts))[inbounds]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        style_ids = np.frombuffer(self.style_ids, dtype=np.int64)[inbounds]
+        if len(counts) > 0:
+            add(nodes.coords[:,positions[keep]], offsets, self.styles, style_ids, check_bounds=False)
+
+        self.refs = array('q')
+        self.counts = array('q')
+        self.style_ids = array('q')
+        return len(counts)
+
+def load_osm(map, path, rules, batch_size=100000):
+    '''
+    Read the `OpenStreetMap XML <https://wiki.openstreetmap.org/wiki/OSM_XML>`_ file *path* and add the features which match *rules* to the :class:`.Map` *map*. The file is read incrementally so the whole document is never in memory, only a compact index of the node coordinates (see :class:`NodeIndex`) and up to *batch_size* buffered ways.
+
+    *rules* is a list of tuples of a tag key, a tag value (or None to match any value) and a style, e.g. ``('highway', 'primary', WayStyle(color='orange'))``. Each feature gets the style of the first rule which matches its tags and which applies to it:
+
+    * a :class:`.NodeStyle` adds tagged nodes with :meth:`.Map.add_nodes`,
+    * a :class:`.NameStyle` adds tagged nodes which have a name with :meth:`.Map.add_names`,
+    * a :class:`.WayStyle` adds ways with :meth:`.Map.add_ways`,
+    * an :class:`.AreaStyle` adds closed ways with :meth:`.Map.add_areas`.
+
+    Features with no node within the bounds of the map are dropped as they are read. Relations are ignored.
+
+    Returns a dictionary with the number of areas, ways, names and nodes added.
+    '''
+    bounds = map.get_latlon_bounds()
+    nodes = NodeIndex(bounds)
+    areas = ShapeBuffer()
+    ways = ShapeBuffer()
+    points = {'names':([], array('d'), []), 'nodes':([], array('d'), [])}
+    summary = {'areas':0, 'ways':0, 'names':0, 'nodes':0}
+
+    root = None
+    for event, element in iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+
+        if element.tag == 'node':
+            lat, lon = float(element.get('lat')), float(element.get('lon'))
+            nodes.append(int(element.get('id')), lat, lon)
+            if len(element) > 0 and bounds[0,0] <= lat <= bounds[0,1] and bounds[1,0] <= lon <= bounds[1,1]:
+                tags = {tag.get('k'):tag.get('v') for tag in element.iter('tag')}
+                style = match(tags, rules, (NameStyle, NodeStyle) if 'name' in tags else NodeStyle)
+                if isinstance(style, NodeStyle):
+                    kind = 'nodes'
+                elif style is not None:
+                    kind = 'names'
+                else:
+                    kind = None
+                if kind is not None:
+                    labels, locations, styles = points[kind]
+                    labels.append(tags.get('name'))
+                    locations.extend((lat, lon))
+                    styles.append(style)
+            root.clear()
+
+        elif element.tag == 'way':
+            refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+            tags = {tag.get('k'):tag.get('v') for tag in element.iter('tag')}
+            if len(refs) > 0 and len(tags) > 0:
+                closed = len(refs) > 2 and refs[0] == refs[-1]
+                style = match(tags, rules, (AreaStyle, WayStyle) if closed else WayStyle)
+                if isinstance(style, AreaStyle):
+                    areas.append(refs, style)
+                elif style is not None:
+                    ways.append(refs, style)
+                if len(areas) >= batch_size:
+                    summary['areas'] += areas.flush(nodes, map.add_areas)
+                if len(ways) >= batch_size:
+                    summary['ways'] += ways.flush(nodes, map.add_ways)
+            root.clear()
+
+        elif element.tag == 'relation':
+            root.clear()
+
+    summary['areas'] += areas.flush(nodes, map.add_areas)
+    summary['ways'] += ways.flush(nodes, map.add_ways)
+
+    labels, locations, styles = points['names']
+    if len(labels) > 0:
+        map.add_names(labels, np.frombuffer(locations, dtype=float).reshape(-1, 2).T, styles, check_bounds=False)
+    labels, locations, styles = points['nodes']
+    if len(styles) > 0:
+        map.add_nodes(np.frombuffer(locations, dtype=float).reshape(-1, 2).T, styles, check_bounds=False)
+    summary['names'] = len(points['names'][0])
+    summary['nodes'] = len(points['nodes'][2])
+    return summary
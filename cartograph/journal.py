@@ -0,0 +1,101 @@
+from os import replace
+from os.path import exists
+
+class Journal():
+    '''
+    Record of the blocks of tiles of a job which have been drawn and stored, kept in the text file *filename* so that an interrupted job can be started again without drawing those blocks again. The first line of the file is the *key* of the job, which identifies its parameters, and the *total* number of tiles of the job. Each following line is a finished block as its zoom level, x_start, x_stop, y_start and y_stop (see :meth:`.Map.blocks`).
+
+    The journal is loaded from *filename* if it exists and has the same *key*, otherwise it is started afresh. A line left unfinished by an interrupted save is dropped and the file is written again in full at the next save. New blocks are appended to the file by :meth:`save`, which should only be called once the tiles of the blocks have been flushed to the sink.
+    '''
+    def __init__(self, filename, key, total=0):
+        self.filename = filename
+        self.key = key
+        self.total = total
+        self.blocks = set()
+        self.new = []
+        self.fresh = True
+        if exists(filename):
+            with open(filename, 'r') as f:
+                header = f.readline().split()
+                if len(header) == 2 and header[0] == key:
+                    self.fresh = False
+                    for line in f:
+                        block = tuple(int(i) for i in line.split())
+                        if len(block) == 5 and line.endswith('\n'):
+                            self.blocks.add(block)
+                        else:
+                            self.fresh = True
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block):
+        return block in self.blocks
+
+    def add(self, zoom, block):
+        '''
+        Record that the *block* of tiles (x_start, x_stop, y_start, y_stop) at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* is finished.
+        '''
+        self.blocks.add((zoom,) + tuple(block))
+        self.new.append((zoom,) + tuple(block))
+
+    def tiles(self):
+        '''
+        Returns the number of tiles in the finished blocks.
+        '''
+        return sum((block[2] - block[1]) * (block[4] - block[3]) for block in self.blocks)
+
+    def save(self):
+        '''
+        Append the blocks added since the last save to the file, so an interrupted save loses at most the last block. If the journal was started afresh, the whole file is written and replaced in one step instead.
+        '''
+        if self.fresh:
+            with open(self.filename + '.tmp', 'w') as f:
+                f.write('%s %d\n' % (self.key, self.total))
+                f.writelines('%d %d %d %d %d\n' % block for block in sorted(self.blocks))
+            replace(self.filename + '.tmp', self.filename)
+        elif len(self.new) > 0:
+            with open(self.filename, 'a') as f:
+                f.writelines('%d %d %d %d %d\n' % block for block in self.new)
+        self.fresh = False
+        self.new = []
+
+def shard_filename(filename, shard):
+    '''
+    Returns the journal file name for *shard*, a tuple (i, n), by adding .i-of-n to *filename*.
+    '''
+    return '%s.%d-of-%d' % (filename, shard[0], shard[1])
+
+def parse_shard(shard):
+    '''
+    Returns *shard*, given as a string 'i/n' or a tuple (i, n) with i from 0 to n-1, as a tuple of integers. Raises a ValueError if it is not valid.
+    '''
+    if isinstance(shard, str):
+        shard = shard.split('/')
+    if len(shard) != 2:
+        raise ValueError('shard must be given as i/n')
+    i, n = int(shard[0]), int(shard[1])
+    if n < 1 or not 0 <= i < n:
+        raise ValueError('shard i/n must have 0 <= i < n')
+    return i, n
+
+def progress(filename, n):
+    '''
+    Returns a list of the number of finished tiles and the total number of tiles of each of the *n* shards whose journals are at *filename* (see :func:`shard_filename`), e.g. when the shards share storage. Shards which have not saved a journal yet have (0, 0).
+    '''
+    counts = []
+    for i in range(n):
+        path = shard_filename(filename, (i, n))
+        if not exists(path):
+            counts.append((0, 0))
+            continue
+        with open(path, 'r') as f:
+            header = f.readline().split()
+            total = int(header[1]) if len(header) == 2 else 0
+            tiles = 0
+            for line in f:
+                block = [int(j) for j in line.split()]
+                if len(block) == 5 and line.endswith('\n'):
+                    tiles += (block[2] - block[1]) * (block[4] - block[3])
+        counts.append((tiles, total))
+    return counts
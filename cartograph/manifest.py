@@ -0,0 +1,58 @@
+import json
+from os import replace
+from os.path import exists
+
+class Manifest():
+    '''
+    Record of the fingerprint of each tile that has been drawn, saved as JSON in the file *filename*. The fingerprint of a tile is a hash of the features and styles which intersect it (see :meth:`.Map.tile_fingerprint`), so a tile only needs to be drawn again if its fingerprint has changed. The manifest is loaded from *filename* if it exists.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        if exists(filename):
+            with open(filename, 'r') as f:
+                self.fingerprints = json.load(f)
+        else:
+            self.fingerprints = {}
+
+    def key(self, x, y, zoom):
+        '''
+        Returns the key of the tile given by *x*, *y* and *zoom*.
+        '''
+        return '%d/%d/%d' % (zoom, x, y)
+
+    def get(self, x, y, zoom):
+        '''
+        Returns the fingerprint of the tile, or None if it is not in the manifest.
+        '''
+        return self.fingerprints.get(self.key(x, y, zoom))
+
+    def set(self, x, y, zoom, fingerprint):
+        '''
+        Record the fingerprint of the tile.
+        '''
+        self.fingerprints[self.key(x, y, zoom)] = fingerprint
+
+    def remove(self, x, y, zoom):
+        '''
+        Remove the tile from the manifest.
+        '''
+        self.fingerprints.pop(self.key(x, y, zoom), None)
+
+    def tiles(self, zoom):
+        '''
+        Returns a list of the (x, y) indices of the tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* in the manifest.
+        '''
+        tiles = []
+        for key in self.fingerprints:
+            z, x, y = key.split('/')
+            if int(z) == zoom:
+                tiles.append((int(x), int(y)))
+        return tiles
+
+    def save(self):
+        '''
+        Save the manifest to its file. The file is replaced in one step so an interrupted save does not lose the previous manifest.
+        '''
+        with open(self.filename + '.tmp', 'w') as f:
+            json.dump(self.fingerprints, f)
+        replace(self.filename + '.tmp', self.filename)
@@ -1,12 +1,23 @@
-from os import mkdir
-from os.path import join
+from multiprocessing import Pool
+from hashlib import sha1
 import numpy as np
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.transforms import Bbox
-from .feature import Area, Way, Name, Node, Elevation
+from matplotlib.colors import to_rgba
+from matplotlib.font_manager import FontProperties
+from matplotlib.path import Path
+from .feature import Area, Way, Name, Node, Elevation, DEMElevation, AreaCollection, WayCollection
 from .style import AreaStyle
-from .projection import mercator, deg2num, num2deg
+from .projection import mercator, deg2num, num2deg, tile_range, tile_cover, tile_extents
+from .index import GridIndex, CollisionGrid
+from .store import AreaTable, WayTable, NameTable, NodeTable
+from .sink import DirectorySink, TileWriter
+from .encode import Encoder
+from .manifest import Manifest
+from .stats import Timer, Stats
+from .pipeline import Pipeline
+from .journal import Journal, parse_shard, shard_filename, progress
 
 class Map():
     '''
@@ -17,6 +28,10 @@ class Map():
         self.ways = []
         self.names = []
         self.nodes = []
+        self.area_table = AreaTable()
+        self.way_table = WayTable()
+        self.node_table = NodeTable()
+        self.name_table = NameTable()
         self.elevation = None
 
         self.bounds = np.zeros((2,2))
@@ -25,8 +40,47 @@ class Map():
         self.latlon_bounds = np.array([[85.0511, -85.0511], [-180.0, 180.0]])
 
         self.figure = None
+        self.canvas = None
         self.axes = None
         self.background = None
+        self.encoder = Encoder()
+        self.simplify = None
+        self.tolerance = None
+        self.batch = False
+        self.declutter = False
+        self.metatile = 1
+        self.label_padding = 2
+        self.coverage = None
+        self.covers = {}
+        self.ranges = {}
+        self.grids = {}
+        self.zoom = None
+        self.timer = Timer()
+
+        self.features = []
+        self.shape_index = None
+        self.label_index = None
+        self.table_index = None
+        self.point_index = None
+        self.first_point = 0
+        self.appears_at = np.zeros(0)
+        self.fingerprints = None
+        self.placements = {}
+        self.extents = None
+        self.visible = set()
+        self.label_artists = {}
+        self.collections = []
+        self.batches = np.zeros(0, dtype=int)
+        self.batch_positions = np.zeros(0, dtype=int)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['figure'] = None
+        state['canvas'] = None
+        state['axes'] = None
+        state['collections'] = []
+        state['label_artists'] = {}
+        return state
 
     def bound_by_box(self, bottom, top, left, right):
         '''
@@ -35,22 +89,17 @@ class Map():
         self.bounds[:,0] = self.projection(bottom, left)
         self.bounds[:,1] = self.projection(top, right)
         self.latlon_bounds = np.array([[top, bottom], [left, right]])
+        self.covers = {}
+        self.ranges = {}
+        self.grids = {}
 
     def bound_by_osm_tiles(self, zoom, *args):
         '''
         Calculate the bounds corresponding to the minimal rectangle of tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that includes one or more points, given by pairs of (lat,lon) coordinates.
         '''
-        min_lat = 85.0511
-        max_lat = -85.0511
-        min_lon = 180.0
-        max_lon = -180.0
-        for lat, lon in args:
-            min_lat = min(min_lat, lat)
-            max_lat = max(max_lat, lat)
-            min_lon = min(min_lon, lon)
-            max_lon = max(max_lon, lon)
-        min_x, min_y = deg2num(max_lat, min_lon, zoom)
-        max_x, max_y = deg2num(min_lat, max_lon, zoom)
+        lat, lon = np.array(args, dtype=float).reshape(-1, 2).T
+        x, y = deg2num(lat, lon, zoom)
+        min_x, max_x, min_y, max_y = int(x.min()), int(x.max()), int(y.min()), int(y.max())
         top, left = num2deg(min_x, min_y, zoom)
         bottom, right = num2deg(max_x+1, max_y+1, zoom)
         self.bound_by_box(bottom, top, left, right)
@@ -76,12 +125,34 @@ class Map():
 
     def number_of_tiles(self, zoom):
         '''
-        Returns the (minimal) number of tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map.
+        Returns the (minimal) number of tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map, or the number of tiles which are drawn if :attr:`coverage` is set (see :meth:`covered_tiles`).
         '''
-        x_start, y_start = deg2num(self.latlon_bounds[0,0], self.latlon_bounds[1,0], zoom)
-        x_stop, y_stop = deg2num(self.latlon_bounds[0,1], self.latlon_bounds[1,1], zoom)
+        if self.coverage is not None:
+            return self.covered_tiles(zoom).shape[1]
+        x_start, x_stop, y_start, y_stop = self.tile_range(zoom)
         return (x_stop - x_start) * (y_stop - y_start)
 
+    def tile_range(self, zoom):
+        '''
+        Returns the range of tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map as a tuple (x_start, x_stop, y_start, y_stop), where the stop indices are not inclusive. The range is kept for each zoom level.
+
+        See also :func:`.projection.tile_range`.
+        '''
+        if zoom not in self.ranges:
+            self.ranges[zoom] = tile_range(self.latlon_bounds[0,0], self.latlon_bounds[0,1], self.latlon_bounds[1,0], self.latlon_bounds[1,1], zoom)
+        return self.ranges[zoom]
+
+    def tile_edges(self, zoom):
+        '''
+        Returns the edges of the tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map in projected coordinates, as a numpy array of the left edges of the columns of tiles followed by the right edge of the last column and a numpy array of the top edges of the rows of tiles followed by the bottom edge of the last row. The edges are computed with :func:`.projection.tile_extents` once for each zoom level, so the bounds of any tile (see :meth:`tile_bounds`) or the tiles under any point are found by indexing or searching these arrays. This assumes the projection maps the edges of tiles to straight lines, as is the case for the default :meth:`projection`.
+        '''
+        if zoom not in self.grids:
+            x_start, x_stop, y_start, y_stop = self.tile_range(zoom)
+            columns = tile_extents(np.arange(x_start, x_stop + 1), np.full(x_stop - x_start + 1, y_start), zoom, self.projection)
+            rows = tile_extents(np.full(y_stop - y_start + 1, x_start), np.arange(y_start, y_stop + 1), zoom, self.projection)
+            self.grids[zoom] = columns[:,0], rows[:,3]
+        return self.grids[zoom]
+
     def projection(self, lat, lon):
         '''
         The projection from lat/lon coordinates to cartesian coordinates. By default, this is the `Mercator projection <https://en.wikipedia.org/wiki/Mercator_projection>`_. Override this method to change the projection.
@@ -108,9 +179,92 @@ class Map():
         if check_bounds and way.is_inbounds(self.bounds):
             self.ways.append(way)
 
+    def add_areas(self, boundaries, offsets, styles, style_ids=None, check_bounds=True):
+        '''
+        Add many area features to the map at once. The (2,M) numpy array *boundaries* holds the lat/lon coordinates of every boundary one after another and area i is made up of the columns *offsets*\\ [i] to *offsets*\\ [i+1]. The style of area i is *styles*\\ [*style_ids*\\ [i]] if the integer array *style_ids* is given, otherwise *styles* is either a list of one :class:`.AreaStyle` per area or a single style for every area. Optionally check that at least one vertex of each boundary is within the bounds of the map (default True).
+
+        The areas are kept in the columnar :attr:`area_table` rather than as :class:`.Area` objects and are always drawn as collections, see :class:`.AreaTable`.
+        '''
+        self.area_table.append(*self.project_shapes(boundaries, offsets, styles, style_ids, check_bounds))
+
+    def add_ways(self, vertices, offsets, styles, style_ids=None, check_bounds=True):
+        '''
+        Add many way features to the map at once. The (2,M) numpy array *vertices* holds the lat/lon coordinates of every way one after another and way i is made up of the columns *offsets*\\ [i] to *offsets*\\ [i+1]. The style of way i is *styles*\\ [*style_ids*\\ [i]] if the integer array *style_ids* is given, otherwise *styles* is either a list of one :class:`.WayStyle` per way or a single style for every way. Optionally check that at least one vertex of each way is within the bounds of the map (default True).
+
+        The ways are kept in the columnar :attr:`way_table` rather than as :class:`.Way` objects and are always drawn as collections without markers, see :class:`.WayTable`.
+        '''
+        self.way_table.append(*self.project_shapes(vertices, offsets, styles, style_ids, check_bounds))
+
+    def project_shapes(self, vertices, offsets, styles, style_ids=None, check_bounds=True):
+        '''
+        Project the lat/lon *vertices* of many shapes at once and optionally drop the shapes without a vertex in the bounds of the map, as for :meth:`add_ways`. Empty shapes are always dropped. Returns the projected vertices, offsets, style indices and styles of the remaining shapes.
+        '''
+        offsets = np.asarray(offsets, dtype=int)
+        style_ids, styles = self.style_indices(styles, style_ids, len(offsets) - 1)
+
+        vertices = np.array(self.projection(vertices[0,offsets[0]:offsets[-1]], vertices[1,offsets[0]:offsets[-1]]))
+        offsets = offsets - offsets[0]
+        counts = np.diff(offsets)
+        keep = counts > 0
+        if check_bounds:
+            inbounds = np.logical_and(np.logical_and(self.bounds[0,0] <= vertices[0], vertices[0] <= self.bounds[0,1]), np.logical_and(self.bounds[1,0] <= vertices[1], vertices[1] <= self.bounds[1,1]))
+            keep[keep] = np.logical_or.reduceat(inbounds, offsets[:-1][keep]) if len(inbounds) > 0 else False
+
+        if not np.all(keep):
+            vertices = vertices[:,np.repeat(keep, counts)]
+            counts = counts[keep]
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            style_ids = style_ids[keep]
+        return vertices, offsets, style_ids, styles
+
+    def style_indices(self, styles, style_ids, n):
+        '''
+        Returns an array of style indices and a list of styles for *n* features added in bulk. If *style_ids* is None, *styles* is either a list of one style per feature or a single style for every feature.
+        '''
+        if style_ids is None:
+            if isinstance(styles, (list, tuple)):
+                numbers = {}
+                style_ids = [numbers.setdefault(id(style), len(numbers)) for style in styles]
+                styles = list({id(style):style for style in styles}.values())
+            else:
+                style_ids = np.zeros(n, dtype=int)
+                styles = [styles]
+        return np.asarray(style_ids, dtype=int), styles
+
+    def add_names(self, labels, locations, styles, style_ids=None, check_bounds=True):
+        '''
+        Add many name features to the map at once with the list of strings *labels* and the (2,N) numpy array *locations*, where each column is a lat/lon coordinate. The styles are given as for :meth:`add_ways`. Optionally check that each location is within the bounds of the map (default True).
+
+        The names are kept in the columnar :attr:`name_table` rather than as :class:`.Name` objects, see :class:`.NameTable`.
+        '''
+        locations, keep, style_ids, styles = self.project_points(locations, styles, style_ids, check_bounds)
+        self.name_table.append(locations, [label for label, k in zip(labels, keep) if k], style_ids, styles)
+
+    def add_nodes(self, locations, styles, style_ids=None, check_bounds=True):
+        '''
+        Add many node features to the map at once with the (2,N) numpy array *locations*, where each column is a lat/lon coordinate. The styles are given as for :meth:`add_ways`. Optionally check that each location is within the bounds of the map (default True).
+
+        The nodes are kept in the columnar :attr:`node_table` rather than as :class:`.Node` objects, see :class:`.NodeTable`.
+        '''
+        locations, keep, style_ids, styles = self.project_points(locations, styles, style_ids, check_bounds)
+        self.node_table.append(locations, [styles[i].text for i in style_ids], style_ids, styles)
+
+    def project_points(self, locations, styles, style_ids=None, check_bounds=True):
+        '''
+        Project the lat/lon *locations* of many points at once and optionally drop the points outside the bounds of the map, as for :meth:`add_names`. Returns the projected locations, a boolean array of the points which were kept and the style indices and styles of the kept points.
+        '''
+        style_ids, styles = self.style_indices(styles, style_ids, locations.shape[1])
+        locations = np.array(self.projection(locations[0], locations[1]))
+        keep = np.ones(locations.shape[1], dtype=bool)
+        if check_bounds:
+            keep = np.logical_and(np.logical_and(self.bounds[0,0] <= locations[0], locations[0] <= self.bounds[0,1]), np.logical_and(self.bounds[1,0] <= locations[1], locations[1] <= self.bounds[1,1]))
+            locations = locations[:,keep]
+            style_ids = style_ids[keep]
+        return locations, keep, style_ids, styles
+
     def add_name(self, label, location, style, check_bounds=True):
         '''
-        Add a name feature to the map with string *label*, (2,) numpy array *location* and :class:`.NameStyle` *style*. Optionally check that the location is within the bounds of the map (default True). Currently this check always returns True.
+        Add a name feature to the map with string *label*, (2,) numpy array *location* and :class:`.NameStyle` *style*. Optionally check that the location is within the bounds of the map (default True).
 
         See also :class:`.Name`
         '''
@@ -120,7 +274,7 @@ class Map():
 
     def add_node(self, location, style, check_bounds=True):
         '''
-        Add a node feature to the map with (2,) numpy array *location* and :class:`.NodeStyle` *style*. Optionally check that the location is within the bounds of the map (default True). Currently this check always returns True.
+        Add a node feature to the map with (2,) numpy array *location* and :class:`.NodeStyle` *style*. Optionally check that the location is within the bounds of the map (default True).
 
         See also :class:`.Node`
         '''
@@ -128,18 +282,40 @@ class Map():
         if check_bounds and node.is_inbounds(self.bounds):
             self.nodes.append(node)
 
-    def add_elevation(self, data, style):
+    def add_elevation(self, data, style, tiled=False):
         '''
         Add elevation data to the map with :class:`.ElevationStyle` *style*. The *data* is expected to be an (3,N) numpy array where each row gives a latitude (in degrees), longitude (in degrees) and elevation (can be in any units).
 
+        If *tiled* is True, the elevation is interpolated for each tile as it is drawn instead of on one grid for the whole map, see :meth:`.Elevation.set_tiled`. The hillshade then assumes the elevation is in metres.
+
         See also :class:`.Elevation`
         '''
         data[0], data[1] = self.projection(data[0], data[1])
         self.elevation = Elevation(data, style)
+        if tiled:
+            self.elevation.set_tiled()
+        else:
+            self.elevation.generate_elevation_grid(self.bounds, self.elevation_resolution())
+
+    def add_dem(self, source, style, extent=None, order=1, tiled=False):
+        '''
+        Add gridded elevation data to the map with :class:`.ElevationStyle` *style*. The *source* is an .hgt or .npy file or a 2D numpy array of elevations with lat/lon *extent*, which is memory-mapped and resampled with interpolation of order *order*. This is much faster than :meth:`add_elevation` for large amounts of data. If *tiled* is True, the elevation is resampled for each tile as it is drawn, as for :meth:`add_elevation`.
+
+        See also :class:`.DEMElevation`
+        '''
+        self.elevation = DEMElevation(source, style, extent, order)
+        if tiled:
+            self.elevation.set_tiled()
+        else:
+            self.elevation.generate_elevation_grid(self.bounds, self.elevation_resolution())
+
+    def elevation_resolution(self):
+        '''
+        Returns the resolution of the elevation grid for the map bounds, which is 100 points per 0.02 degrees.
+        '''
         resolution = np.array([self.latlon_bounds[0,0] - self.latlon_bounds[0,1], self.latlon_bounds[1,1] - self.latlon_bounds[1,0]])
         resolution *= 100/0.02
-        resolution = resolution.astype(np.int)
-        self.elevation.generate_elevation_grid(self.bounds, resolution)
+        return resolution.astype(int)
 
     def set_background_color(self, background_color):
         '''
@@ -152,6 +328,23 @@ class Map():
         boundary = np.array([[self.bounds[0,0], self.bounds[0,1], self.bounds[0,1], self.bounds[0,0]], [self.bounds[1,0], self.bounds[1,0], self.bounds[1,1], self.bounds[1,1]]])
         self.background = Area(boundary, AreaStyle(color=background_color))
 
+    def set_relief_cache(self, directory):
+        '''
+        Keep the shaded relief of the elevation in *directory* so it is computed once and shared by parallel processes and later runs. The elevation must have been added first.
+
+        See also :meth:`.Elevation.relief`.
+        '''
+        self.elevation.relief_cache = directory
+        self.elevation.relief_image = None
+
+    def set_encoder(self, format='png', **options):
+        '''
+        Set the image *format* of the tiles and any encoding *options*, such as the PNG compression level or palette quantization.
+
+        See also :class:`.Encoder`.
+        '''
+        self.encoder = Encoder(format, **options)
+
     def create_figure(self, width, height):
         '''
         Create a figure to draw the map onto.
@@ -163,24 +356,38 @@ class Map():
 
     def plot(self):
         '''
-        Plot the map features. This method does not create the figure, :meth:`create_figure` must be called first.
+        Plot the map features. This method does not create the figure, :meth:`create_figure` must be called first. If :attr:`batch` is True, areas and ways are plotted as collections, see :meth:`plot_collections`. The areas and ways in :attr:`area_table` and :attr:`way_table` are always plotted as collections, while the text of the nodes and names in :attr:`node_table` and :attr:`name_table` is only created when they are made visible by :meth:`cull`.
 
         See also :meth:`draw_zoom_levels` and :meth:`draw_image`.
         '''
+        self.build_index()
+        self.zoom = None
+        self.collections = []
+        self.label_artists = {}
+        self.batches = np.full(len(self.appears_at), -1)
+        self.batch_positions = np.zeros(len(self.appears_at), dtype=int)
+
         if self.background is not None:
             self.background.plot(self.axes)
 
         if self.elevation is not None:
-            self.elevation.draw_background_image(self.axes)
-            self.elevation.draw_hillshade(self.axes)
+            if self.elevation.tiled:
+                self.elevation.images = []
+            else:
+                self.elevation.plot_relief(self.axes)
 
-        for area in self.areas:
-            area.plot(self.axes)
-            area.set_visible(False)
+        rows = len(self.features)
+        for features, first, table, collection_type in [(self.areas, 0, self.area_table, AreaCollection), (self.ways, len(self.areas), self.way_table, WayCollection)]:
+            if self.batch:
+                self.plot_collections(features, first, collection_type)
+            else:
+                for feature in features:
+                    feature.plot(self.axes)
+                    feature.set_visible(False)
 
-        for way in self.ways:
-            way.plot(self.axes)
-            way.set_visible(False)
+            for collection, ids in table.collections():
+                self.add_collection(collection, rows + ids)
+            rows += len(table)
 
         for node in self.nodes:
             node.plot(self.axes)
@@ -190,83 +397,745 @@ class Map():
             name.plot(self.axes)
             name.set_visible(False)
 
-    def draw_zoom_levels(self, min, max=None, directory='tiles', disp=False):
+    def plot_collections(self, features, first, collection_type):
+        '''
+        Plot the areas or ways *features*, which start at index *first* in :attr:`features`, as one *collection_type* (:class:`.AreaCollection` or :class:`.WayCollection`) for each style. Features with the same style object appear at the same zoom level, so each collection is shown or hidden as a whole by :meth:`cull` with a single call rather than one call per feature. Ways with markers cannot be drawn by a collection and are plotted individually after the collections.
+        '''
+        groups = {}
+        individual = []
+        for i, feature in enumerate(features):
+            if isinstance(feature, Way) and feature.style.markerstyle:
+                individual.append(i)
+            else:
+                groups.setdefault(id(feature.style), []).append(i)
+
+        for group in groups.values():
+            shapes = [features[i].boundary if isinstance(features[i], Area) else features[i].vertices for i in group]
+            offsets = np.cumsum([0] + [shape.shape[1] for shape in shapes])
+            self.add_collection(collection_type(np.concatenate(shapes, axis=1), offsets, features[group[0]].style), first + np.array(group))
+
+        for i in individual:
+            features[i].plot(self.axes)
+            features[i].set_visible(False)
+
+    def add_collection(self, collection, ids):
+        '''
+        Plot the :class:`.Collection` *collection* of the features with *ids* (see :meth:`query`), which are drawn by :meth:`cull` with the collection rather than individually.
+        '''
+        collection.plot(self.axes)
+        self.batches[ids] = len(self.collections)
+        self.batch_positions[ids] = np.arange(len(ids))
+        self.collections.append(collection)
+
+    def tiles(self, zoom):
+        '''
+        Generate the (x, y) indices of the tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map, or only the tiles from :meth:`covered_tiles` if :attr:`coverage` is set.
+        '''
+        if self.coverage is not None:
+            for x, y in self.covered_tiles(zoom).T.tolist():
+                yield x, y
+            return
+
+        x, y = tile_cover(*self.tile_range(zoom))
+        yield from zip(x.tolist(), y.tolist())
+
+    def set_coverage(self, coverage=None):
+        '''
+        Only draw some of the tiles within the bounds of the map. If *coverage* is 'features', only the tiles with a feature near them are drawn. Otherwise *coverage* is a (2,N) numpy array of lat/lon coordinates of a polygon, as for :meth:`add_area`, and only the tiles which overlap the polygon are drawn. If *coverage* is None (the default), every tile is drawn.
+
+        See also :meth:`covered_tiles`.
+        '''
+        self.coverage = coverage
+        self.covers = {}
+
+    def covered_tiles(self, zoom):
+        '''
+        Returns the tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* within the map which are covered by :attr:`coverage` (see :meth:`set_coverage`) as a (2,N) numpy array of x and y indices, sorted by x and then y. The result is kept for each zoom level.
+
+        For 'features', these are the tiles near a feature, with the same padding as :meth:`query` so that features drawn over the edge of a tile are included. Ways are followed along their vertices, while areas, nodes and names are taken by their bounding boxes since areas can be filled. Every feature is included whatever zoom level it appears at, and the background and elevation are not taken into account. :meth:`build_index` must be called first.
+
+        For a polygon, these are the tiles whose centre is within the polygon or which contain a point of its boundary.
+
+        Lines are sampled at a quarter of the tile width (see :meth:`sample_lines`) and every feature or tile is handled at once with numpy. If the tiles of the zoom level above have already been found, only the children of those tiles are considered, so that the tiles under empty tiles are skipped.
+        '''
+        if zoom in self.covers:
+            return self.covers[zoom]
+
+        x_start, x_stop, y_start, y_stop = self.tile_range(zoom)
+        x_edges, y_edges = self.tile_edges(zoom)
+        width = x_edges[1] - x_edges[0]
+        height = y_edges[0] - y_edges[1]
+
+        def cover(bboxes):
+            i0 = np.maximum(x_start + np.searchsorted(x_edges, bboxes[0], 'right') - 1, x_start)
+            i1 = np.minimum(x_start + np.searchsorted(x_edges, bboxes[1], 'right') - 1, x_stop - 1)
+            j0 = np.maximum(y_start + np.searchsorted(-y_edges, -bboxes[3], 'right') - 1, y_start)
+            j1 = np.minimum(y_start + np.searchsorted(-y_edges, -bboxes[2], 'right') - 1, y_stop - 1)
+            inside = np.logical_and(i0 <= i1, j0 <= j1)
+            i0, i1, j0, j1 = i0[inside], i1[inside], j0[inside], j1[inside]
+            counts = (i1 - i0 + 1) * (j1 - j0 + 1)
+            items = np.repeat(np.arange(len(counts)), counts)
+            k = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+            rows = (j1 - j0 + 1)[items]
+            return np.unique((i0[items] + k // rows) * 2**zoom + j0[items] + k % rows)
+
+        parents = self.covers.get(zoom - 1)
+        if parents is not None:
+            candidates = 2*np.repeat(parents, 4, axis=1) + np.tile([[0, 1, 0, 1], [0, 0, 1, 1]], parents.shape[1])
+        else:
+            candidates = tile_cover(x_start, x_stop, y_start, y_stop)
+        candidates = candidates[:,np.logical_and(np.logical_and(x_start <= candidates[0], candidates[0] < x_stop), np.logical_and(y_start <= candidates[1], candidates[1] < y_stop))]
+
+        if isinstance(self.coverage, str):
+            if self.coverage != 'features':
+                raise ValueError('Unknown coverage %s' % self.coverage)
+            ways = [way.vertices for way in self.ways]
+            vertices = np.concatenate([np.zeros((2,0))] + ways + [self.way_table.vertices], axis=1)
+            offsets = np.concatenate([np.cumsum([0] + [way.shape[1] for way in ways]), self.way_table.offsets[1:] + sum(way.shape[1] for way in ways)])
+            points = self.sample_lines(vertices, offsets, min(width, height) / 4)
+
+            areas = np.array([area.get_bbox() for area in self.areas]).reshape(-1, 4).T
+            shapes = np.concatenate([points[[0,0,1,1]], areas, self.area_table.get_bboxes()], axis=1) + np.array([[-width/8], [width/8], [-width/8], [width/8]])
+            labels = np.concatenate([self.label_index.bboxes, self.point_index.bboxes], axis=1) + np.array([[-width], [width], [-width], [width]])
+            keys = np.union1d(cover(shapes), cover(labels))
+        else:
+            polygon = np.array(self.projection(self.coverage[0], self.coverage[1]))
+            polygon = np.concatenate([polygon, polygon[:,:1]], axis=1)
+            centres = np.array([x_edges[candidates[0] - x_start] + x_edges[candidates[0] - x_start + 1], y_edges[candidates[1] - y_start] + y_edges[candidates[1] - y_start + 1]]) / 2
+            inside = Path(polygon.T).contains_points(centres.T)
+            points = self.sample_lines(polygon, [0, polygon.shape[1]], min(width, height) / 4)
+            keys = np.union1d(candidates[0,inside] * 2**zoom + candidates[1,inside], cover(points[[0,0,1,1]]))
+
+        keys = np.intersect1d(keys, candidates[0] * 2**zoom + candidates[1])
+        self.covers[zoom] = np.array([keys // 2**zoom, keys % 2**zoom], dtype=np.int64).reshape(2, -1)
+        return self.covers[zoom]
+
+    def sample_lines(self, vertices, offsets, spacing):
+        '''
+        Returns points along the lines through the (2,M) numpy array *vertices*, where line i is made up of the columns *offsets*\\ [i] to *offsets*\\ [i+1], as a (2,K) numpy array. The points include every vertex and are at most *spacing* apart in each coordinate along every segment.
+        '''
+        offsets = np.asarray(offsets, dtype=int)
+        segment = np.ones(vertices.shape[1], dtype=bool)
+        segment[offsets[1:] - 1] = False
+        segment = np.flatnonzero(segment[:-1]) if vertices.shape[1] > 0 else np.zeros(0, dtype=int)
+        start = vertices[:,segment]
+        step = vertices[:,segment+1] - start
+        samples = np.maximum(np.ceil(np.max(np.abs(step), axis=0, initial=0) / spacing).astype(int), 1)
+        k = np.repeat(np.arange(len(samples)), samples)
+        t = (np.arange(len(k)) - np.repeat(np.cumsum(samples) - samples, samples)) / samples[k]
+        return np.concatenate([vertices, start[:,k] + t * step[:,k]], axis=1)
+
+    def set_zoom(self, zoom):
+        '''
+        Prepare to draw tiles at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom*. Contours are plotted for *zoom* if it is at least the contour zoom level of the elevation style, see :meth:`.Elevation.plot_contour_layer` (or for each tile if the elevation is tiled, see :meth:`draw_elevation`), and all the features are hidden, to be made visible around each tile by :meth:`cull`. If :attr:`simplify` is set, the geometry tolerance is updated to that number of pixels at *zoom*. The features must have been plotted first.
+        '''
+        self.zoom = zoom
+
+        if self.elevation is not None:
+            self.elevation.remove_contours()
+            if zoom >= self.elevation.style.contour_appears_at and not self.elevation.tiled:
+                bounds = self.tile_bounds(0, 1, 0, 1, zoom)
+                self.elevation.plot_contour_layer(self.axes, (bounds[0,1] - bounds[0,0]) / 256)
+
+        for i in self.visible:
+            self.set_visible(i, False)
+        self.visible = set()
+        for collection in self.collections:
+            collection.show([])
+
+        if self.simplify is not None:
+            bounds = self.tile_bounds(0, 1, 0, 1, zoom)
+            self.tolerance = self.simplify * (bounds[0,1] - bounds[0,0]) / 256
+        else:
+            self.tolerance = None
+
+    def build_index(self):
+        '''
+        Build the spatial indices of the areas and ways, of the nodes and names, of the rows of the area and way tables and of the rows of the node and name tables. These are used by :meth:`cull` to find the features near each tile. This method is called by :meth:`plot`.
+        '''
+        shapes = self.areas + self.ways
+        labels = self.nodes + self.names
+        self.features = shapes + labels
+        self.shape_index = GridIndex(np.array([feature.get_bbox() for feature in shapes]).T)
+        self.label_index = GridIndex(np.array([feature.get_bbox() for feature in labels]).T)
+        self.table_index = GridIndex(np.concatenate([self.area_table.get_bboxes(), self.way_table.get_bboxes()], axis=1))
+        self.point_index = GridIndex(np.concatenate([self.node_table.get_bboxes(), self.name_table.get_bboxes()], axis=1))
+        self.first_point = len(self.features) + len(self.table_index)
+        self.appears_at = np.concatenate([np.array([feature.style.appears_at for feature in self.features], dtype=float), self.area_table.appears_at(), self.way_table.appears_at(), self.node_table.appears_at(), self.name_table.appears_at()])
+        self.fingerprints = None
+        self.placements = {}
+        self.extents = None
+        self.visible = set()
+
+    def label_extents(self):
+        '''
+        Returns the indices (see :meth:`query`) of the nodes and names, their locations as a (2,N) numpy array, the approximate width and height of their text in points as a (2,N) numpy array and the ranks of their styles. The size of the text is estimated from the number of characters and lines rather than measured. :meth:`build_index` must be called first.
+        '''
+        if self.extents is not None:
+            return self.extents
+
+        def size(text, style):
+            lines = text.split('\n')
+            fontsize = FontProperties(size=style.fontsize).get_size_in_points()
+            return 0.6*fontsize*max(len(line) for line in lines), 1.2*fontsize*len(lines)
+
+        labels = self.nodes + self.names
+        ids = [np.arange(len(self.shape_index), len(self.features))]
+        locations = [np.array([label.location for label in labels], dtype=float).reshape(-1, 2).T]
+        sizes = [np.array([size(label.name, label.style) for label in labels], dtype=float).reshape(-1, 2).T]
+        ranks = [np.array([label.style.rank for label in labels], dtype=float)]
+
+        first = self.first_point
+        for table in [self.node_table, self.name_table]:
+            text = np.array([max(len(line) for line in label.split('\n')) for label in table.labels] + [0], dtype=float)[table.label_ids]
+            lines = np.array([label.count('\n') + 1 for label in table.labels] + [0], dtype=float)[table.label_ids]
+            fontsizes = np.array([FontProperties(size=style.fontsize).get_size_in_points() for style in table.styles] + [0], dtype=float)[table.style_ids]
+            ids.append(np.arange(first, first + len(table)))
+            locations.append(table.locations)
+            sizes.append(np.array([0.6*fontsizes*text, 1.2*fontsizes*lines]))
+            ranks.append(np.array([style.rank for style in table.styles] + [0], dtype=float)[table.style_ids])
+            first += len(table)
+
+        self.extents = np.concatenate(ids), np.concatenate(locations, axis=1), np.concatenate(sizes, axis=1), np.concatenate(ranks)
+        return self.extents
+
+    def place_labels(self, zoom):
+        '''
+        Choose the nodes and names to draw at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* so that no two labels overlap. The labels which appear at *zoom* are placed one at a time in order of the rank of their style (highest first) and then the order they were added, and a label is dropped if its box, padded by :attr:`label_padding` pixels, overlaps a label already placed (see :class:`.CollisionGrid`). The placement is done once for the whole map at each zoom level, so it is the same whichever tiles are drawn and in whatever order.
+
+        Returns a boolean numpy array over the indices of :meth:`query` which is False for the labels that were dropped and True for everything else. :meth:`build_index` must be called first.
+        '''
+        if zoom in self.placements:
+            return self.placements[zoom]
+
+        ids, locations, sizes, ranks = self.label_extents()
+        bounds = self.tile_bounds(0, 1, 0, 1, zoom)
+        pixel = (bounds[0,1] - bounds[0,0]) / 256
+        scale = pixel * 256 / 72
+        pad = self.label_padding * pixel
+        x0 = locations[0] - scale*sizes[0]/2 - pad
+        x1 = locations[0] + scale*sizes[0]/2 + pad
+        y0 = locations[1] - 0.2*scale*sizes[1] - pad
+        y1 = locations[1] + 0.8*scale*sizes[1] + pad
+
+        placed = np.ones(len(self.appears_at), dtype=bool)
+        placed[ids] = False
+        candidates = np.flatnonzero(self.appears_at[ids] <= zoom)
+        grid = CollisionGrid(128*pixel)
+        for k in candidates[np.lexsort((candidates, -ranks[candidates]))]:
+            if grid.place((x0[k], x1[k], y0[k], y1[k])):
+                placed[ids[k]] = True
+
+        self.placements[zoom] = placed
+        return placed
+
+    def query(self, bounds, zoom):
+        '''
+        Returns the indices in :attr:`features` of the features that appear at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* and intersect *bounds*, given in projected coordinates. Indices from the length of :attr:`features` onwards are the rows of :attr:`area_table`, :attr:`way_table`, :attr:`node_table` and :attr:`name_table` in that order. Areas and ways are included if they are within an eighth of the width of *bounds* to allow for the line width, and nodes and names if they are within one width since the text extends beyond the location. If :attr:`declutter` is True, only the nodes and names chosen by :meth:`place_labels` are included. :meth:`build_index` must be called first.
+        '''
+        width = bounds[0,1] - bounds[0,0]
+        shapes = self.shape_index.query(bounds + np.array([[-width/8, width/8], [-width/8, width/8]]))
+        labels = self.label_index.query(bounds + np.array([[-width, width], [-width, width]])) + len(self.shape_index)
+        tables = self.table_index.query(bounds + np.array([[-width/8, width/8], [-width/8, width/8]])) + len(self.features)
+        points = self.point_index.query(bounds + np.array([[-width, width], [-width, width]])) + self.first_point
+        ids = np.concatenate([shapes, labels, tables, points])
+        ids = ids[self.appears_at[ids] <= zoom]
+        if self.declutter:
+            ids = ids[self.place_labels(zoom)[ids]]
+        return ids
+
+    def tile_fingerprint(self, x, y, zoom):
+        '''
+        Returns a hash (hex string) of everything drawn on the tile given by *x*, *y* and *zoom*: the features found by :meth:`query`, the background, the elevation, the simplification, whether features are batched, the size of the metatiles and the encoder settings. Returns None if nothing would be drawn on the tile. :meth:`build_index` must be called first.
+
+        See also :class:`.Manifest`.
+        '''
+        if self.fingerprints is None:
+            self.fingerprints = [feature.fingerprint() for feature in self.features] + self.area_table.fingerprints() + self.way_table.fingerprints() + self.node_table.fingerprints() + self.name_table.fingerprints()
+
+        ids = self.query(self.tile_bounds(x, x+1, y, y+1, zoom), zoom)
+        if len(ids) == 0 and self.background is None and self.elevation is None:
+            return None
+
+        h = sha1(repr((zoom, self.simplify, self.batch, self.metatile, sorted(vars(self.encoder).items()))).encode())
+        for feature in [self.background, self.elevation]:
+            if feature is not None:
+                h.update(feature.fingerprint())
+        for i in ids:
+            h.update(self.fingerprints[i])
+        return h.hexdigest()
+
+    def cull(self, bounds):
+        '''
+        Make visible only the features that appear at the current zoom level and intersect *bounds*, given in projected coordinates. Features plotted in collections are shown with one :meth:`.Collection.show` call per collection and the contours with :meth:`.ContourLayer.show`. Only the window of the elevation relief within *bounds* is drawn, see :meth:`.Elevation.show_relief`.
+
+        See also :meth:`query`.
+        '''
+        ids = self.query(bounds, self.zoom)
+        if len(self.collections) > 0:
+            batches = self.batches[ids]
+            order = np.argsort(batches, kind='stable')
+            counts = np.bincount(batches + 1, minlength=len(self.collections) + 1)
+            parts = np.split(ids[order], np.cumsum(counts)[:-1])
+            ids = parts[0]
+            for collection, part in zip(self.collections, parts[1:]):
+                collection.show(self.batch_positions[part], self.tolerance)
+                self.timer.count('artists', len(part))
+
+        if self.elevation is not None and self.elevation.relief_artist is not None:
+            self.elevation.show_relief(bounds)
+
+        if self.elevation is not None and self.elevation.layer is not None:
+            self.elevation.layer.show(bounds)
+
+        visible = set(ids.tolist())
+        for i in self.visible - visible:
+            self.set_visible(i, False)
+        for i in visible - self.visible:
+            self.set_visible(i, True)
+        self.visible = visible
+        self.timer.count('artists', len(visible))
+
+    def set_visible(self, i, visible):
+        '''
+        Make the feature with index *i* (see :meth:`query`) visible or not, simplifying it first if :attr:`tolerance` is set. The text of a row of :attr:`node_table` or :attr:`name_table` is created when it is made visible and removed when it is hidden. Its z-order is set from the row so the text is drawn in the same order however the rows were made visible, after any :class:`.Name` objects.
+        '''
+        if i < len(self.features):
+            if visible and self.tolerance is not None:
+                self.features[i].simplify(self.tolerance)
+            self.features[i].set_visible(visible)
+        elif visible:
+            row = i - self.first_point
+            zorder = 3 + (row + 1) / (len(self.appears_at) - self.first_point + 1)
+            if row < len(self.node_table):
+                self.label_artists[i] = self.node_table.plot(row, self.axes, zorder)
+            else:
+                self.label_artists[i] = self.name_table.plot(row - len(self.node_table), self.axes, zorder)
+        else:
+            self.label_artists.pop(i).remove()
+
+    def blocks(self, zoom, metatile=1):
+        '''
+        Generate the blocks of at most *metatile* by *metatile* tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* that cover the map. Each block is given as a tuple (x_start, x_stop, y_start, y_stop) of tile indices, where the stop indices are not inclusive. The blocks are aligned to multiples of *metatile* so that the same block is drawn whatever the bounds of the map. If :attr:`coverage` is set, only the blocks with a tile from :meth:`covered_tiles` are generated, as single tiles if *metatile* is one.
+        '''
+        x_start, x_stop, y_start, y_stop = self.tile_range(zoom)
+        if self.coverage is not None:
+            for x, y in np.unique(self.covered_tiles(zoom) // metatile, axis=1).T.tolist():
+                x, y = x * metatile, y * metatile
+                yield max(x, x_start), min(x + metatile, x_stop), max(y, y_start), min(y + metatile, y_stop)
+            return
+
+        for x in range(x_start - x_start % metatile, x_stop, metatile):
+            for y in range(y_start - y_start % metatile, y_stop, metatile):
+                yield max(x, x_start), min(x + metatile, x_stop), max(y, y_start), min(y + metatile, y_stop)
+
+    def tile_bounds(self, x_start, x_stop, y_start, y_stop, zoom):
+        '''
+        Returns the bounds in projected coordinates of the block of tiles from *x_start* to *x_stop* and *y_start* to *y_stop* (not inclusive) at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom*. Blocks within the map are looked up in :meth:`tile_edges`.
+        '''
+        x_first, x_last, y_first, y_last = self.tile_range(zoom)
+        if x_first <= x_start and x_stop <= x_last and y_first <= y_start and y_stop <= y_last:
+            x_edges, y_edges = self.tile_edges(zoom)
+            return np.array([[x_edges[x_start - x_first], x_edges[x_stop - x_first]], [y_edges[y_stop - y_first], y_edges[y_start - y_first]]])
+        lat, lon = num2deg(np.array([x_start, x_stop]), np.array([y_stop, y_start]), zoom)
+        x, y = self.projection(lat, lon)
+        return np.array([x, y])
+
+    def draw_zoom_levels(self, min, max=None, directory='tiles', disp=False, workers=1, metatile=1, sink=None, skip_blank=False, incremental=False, manifest=None, pyramid=None, simplify=None, batch=False, declutter=False, coverage=None, stats=None, threads=0, journal=None, shard=None, checkpoint=100):
         '''
         Draw all the tiles from `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *min* (inclusive) to *max* (not inclusve). If *max* is not given, draws the tiles for `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *min* only. The tiles are saved using `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_ within the parent directory *directory*. Optionally display progress (default False).
+
+        If *workers* is greater than one, the tiles are drawn in parallel by that many processes. Each process plots its own copy of the map once and then draws a share of the tiles.
+
+        If *metatile* is greater than one, blocks of *metatile* by *metatile* tiles are drawn as a single image which is then sliced into tiles, see :meth:`render_metatile`. This sets :attr:`metatile` while drawing and the previous value is restored afterwards, even if drawing fails.
+
+        The tiles can be stored somewhere other than *directory* by giving a :class:`.TileSink` *sink*, e.g. an :class:`.MBTilesSink`. The sink is flushed at the end but not closed. When drawing in parallel, the tiles are sent back to this process to be written. Identical tiles can be stored once by the sink, e.g. with the *link* option of :class:`.DirectorySink`.
+
+        If *skip_blank* is True, tiles which only contain the background colour (or nothing if there is no background) are not written and any tile already stored in their place is deleted, see :meth:`is_blank`.
+
+        If *incremental* is True, only the tiles whose fingerprint (see :meth:`tile_fingerprint`) has changed since the last drawing are drawn. The fingerprints are kept in the :class:`.Manifest` file *manifest*, by default the manifest path of the sink (manifest.json in *directory*). Tiles in the manifest which no longer have anything drawn on them, or are no longer within the bounds of the map, are deleted from the sink.
+
+        If *pyramid* is given, only the zoom levels from *pyramid* (or the deepest zoom level if *pyramid* is True) are drawn from the features. The zoom levels above are built from the tiles of the next zoom level, see :meth:`downsample_tile`, unless :meth:`can_downsample` is False for that zoom level. The tiles of the next zoom level are read back from the sink.
+
+        If *simplify* is given, ways and areas are simplified at each zoom level so that the simplified geometry is within *simplify* pixels of the original, see :meth:`.Way.simplify`. This sets :attr:`simplify` while drawing and the previous value is restored afterwards, even if drawing fails.
+
+        If *batch* is True, areas and ways which share a style object are drawn as one collection per style, which is much faster for maps with many features, see :meth:`plot_collections`. Features in the same collection are drawn in the order they were added, but collections of different styles are drawn one after the other, so overlapping areas or ways of different styles may be drawn in a different order. This sets :attr:`batch` while drawing and the previous value is restored afterwards, even if drawing fails.
+
+        If *declutter* is True, nodes and names which would overlap a label of a higher rank are not drawn, see :meth:`place_labels`. This sets :attr:`declutter` while drawing and the previous value is restored afterwards, even if drawing fails.
+
+        If *coverage* is given, only the tiles covered by the features or a polygon are drawn rather than every tile within the bounds of the map, see :meth:`set_coverage` and :meth:`covered_tiles`. Tiles under empty tiles are skipped without being checked. If the tiles are drawn incrementally, tiles in the manifest which are no longer covered are deleted. Coverage cannot be combined with *metatile* greater than one, since a block can have tiles outside the coverage, and a ValueError is raised if it is. This sets :attr:`coverage` while drawing and the previous coverage is restored afterwards, even if drawing fails.
+
+        If *threads* is greater than zero, the tiles are encoded by that many threads and written by another thread while the next block of tiles is drawn, see :class:`.Pipeline`. Threads cannot be combined with more than one worker, since the worker processes encode their own tiles, and a ValueError is raised if they are.
+
+        If *stats* is given, the time spent drawing each block of tiles is recorded in stages, with the number of visible features and the number of bytes written, see :class:`.Stats`. *stats* can be a :class:`.Stats` object, which holds the records and the summary afterwards, or a function which is called with each record. If *disp* is True, a summary of the tiles per second and the time per tile is shown at the end.
+
+        If *journal* is given, the blocks of tiles which have been drawn are recorded in the :class:`.Journal` file *journal* so that an interrupted job can be run again with the same arguments and only draws the blocks which were not finished. The sink is flushed and the journal saved every *checkpoint* blocks. The journal is started afresh if the arguments change, but not if the features of the map change, in which case the journal should be deleted or the tiles drawn incrementally.
+
+        If *shard* is given as 'i/n' (or a tuple (i, n)) with i from 0 to n-1, only the i-th of n disjoint shares of the blocks of each zoom level are drawn, so that n processes or machines can draw the tiles together. The blocks of each zoom level are dealt out in turn, so the shards have the same number of tiles to within a block per zoom level and neighbouring blocks are spread across the shards. The journal of each shard is kept in its own file, see :func:`.shard_filename`, and if *disp* is True and the shards share storage, the progress of every shard is shown at the end, see :func:`.progress`. Shards cannot be combined with *pyramid* or *incremental*, since those need the tiles or manifest of the whole job. Run the zoom levels above a sharded job as a separate job with *pyramid* once all the shards are finished.
+
+        Returns a dictionary with the number of tiles drawn, the number of blank tiles skipped, the number of duplicate tiles stored once by the sink, the number of unchanged tiles, the number of deleted tiles and the number of tiles skipped because they were already finished according to the journal.
         '''
         if max is None:
             max = min + 1
+        if shard is not None:
+            shard = parse_shard(shard)
+            if (pyramid is not None and pyramid is not False) or incremental:
+                raise ValueError('A sharded job cannot be drawn as a pyramid or incrementally')
+        if threads > 0 and workers > 1:
+            raise ValueError('The tiles drawn by worker processes are encoded by the workers, so threads cannot be used with more than one worker')
+        if metatile > 1 and coverage is not None:
+            raise ValueError('Metatiles cannot be drawn with coverage, since they would draw tiles outside the coverage')
+        if stats is not None and not isinstance(stats, Stats):
+            stats = Stats(stats)
+        elif stats is None and disp:
+            stats = Stats()
+        if stats is not None:
+            stats.begin()
+        old_simplify = self.simplify
+        old_batch = self.batch
+        old_declutter = self.declutter
+        old_metatile = self.metatile
+        old_coverage = self.coverage
+        self.simplify = simplify
+        self.batch = batch
+        self.declutter = declutter
+        self.metatile = metatile
+        self.set_coverage(coverage)
+        try:
+            if isinstance(coverage, str):
+                self.build_index()
 
-        self.create_figure(1, 1)
-        self.plot()
+            downsampled = set()
+            if pyramid is not None and pyramid is not False:
+                self.build_index()
+                cutoff = max - 1 if pyramid is True else np.minimum(pyramid, max - 1)
+                downsampled = set(zoom for zoom in range(min, cutoff) if self.can_downsample(zoom))
+
+            if sink is None:
+                sink = DirectorySink(directory, self.encoder.extension)
+            sink.set_format(self.encoder.format)
+
+            if incremental:
+                if manifest is None:
+                    manifest = sink.manifest_path
+                if manifest is None:
+                    raise ValueError('A manifest file is needed to draw incrementally with this sink')
+                manifest = Manifest(manifest)
+                self.build_index()
+            else:
+                manifest = None
 
-        if disp:
-            n_base_tiles = self.number_of_tiles(min)
-            n_tiles = n_base_tiles * (4**(max-min) - 1) / 3
+            job = self.plan_blocks(min, max, metatile, downsampled, shard)
+            if journal is not None:
+                key = sha1(repr((min, max, metatile, skip_blank, shard, pyramid, sorted(vars(self.encoder).items()), self.simplify, self.batch, self.declutter, coverage if isinstance(coverage, str) or coverage is None else np.asarray(coverage).tolist(), self.bounds.tolist())).encode()).hexdigest()
+                total = sum((block[1] - block[0]) * (block[3] - block[2]) for zoom_blocks in job for block in zoom_blocks)
+                journal_path = journal
+                journal = Journal(journal if shard is None else shard_filename(journal, shard), key, total)
+
+            writer = TileWriter(sink, manifest, journal, stats, checkpoint)
+            work, pyramid_work = self.select_blocks(min, job, writer, downsampled)
+            n_tiles = sum((block[1] - block[0]) * (block[3] - block[2]) for zoom, block in work) + len(pyramid_work)
             tile_number = 1
+            plotted = False
 
-        for zoom in range(min, max):
-            if self.elevation is not None and zoom >= self.elevation.style.contour_appears_at:
-                self.elevation.plot_contours(self.axes)
-
-            for area in self.areas:
-                if zoom >= area.style.appears_at:
-                    area.set_visible(True)
-
-            for way in self.ways:
-                if zoom >= way.style.appears_at:
-                    way.set_visible(True)
-
-            for node in self.nodes:
-                if zoom >= node.style.appears_at:
-                    node.set_visible(True)
-
-            for name in self.names:
-                if zoom >= name.style.appears_at:
-                    name.set_visible(True)
-
-            x_start, y_start = deg2num(self.latlon_bounds[0,0], self.latlon_bounds[1,0], zoom)
-            x_stop, y_stop = deg2num(self.latlon_bounds[0,1], self.latlon_bounds[1,1], zoom)
-            for x in range(x_start, x_stop):
-                for y in range(y_start, y_stop):
-                    if disp:
-                        print('Drawing tiles...(%d/%d)' % (tile_number, n_tiles), end='\r')
-                        tile_number += 1
-                    self.draw_tile(x, y, zoom, directory)
-
-            if self.elevation is not None and zoom >= self.elevation.style.contour_appears_at:
+            if workers > 1:
+                chunks = []
+                for zoom in range(min, max):
+                    blocks = [block for z, block in work if z == zoom]
+                    chunksize = int(np.clip(len(blocks) // (4*workers), 1, 64))
+                    for i in range(0, len(blocks), chunksize):
+                        chunks.append((zoom, blocks[i:i+chunksize], skip_blank))
+
+                if self.elevation is not None and not self.elevation.tiled:
+                    self.elevation.relief()
+                with Pool(workers, initializer=_init_worker, initargs=(self,)) as pool:
+                    for zoom, results in pool.imap_unordered(_render_blocks, chunks):
+                        for block, tiles, times in results:
+                            writer(zoom, block, tiles, times)
+                            tile_number += (block[1] - block[0]) * (block[3] - block[2])
+                        if disp:
+                            print('Drawing tiles...(%d/%d)' % (tile_number - 1, n_tiles), end='\r')
+            elif len(work) > 0:
+                self.create_figure(1, 1)
+                self.plot()
+                plotted = True
+
+                pipeline = Pipeline(self.encoder, writer, threads) if threads > 0 else None
+                try:
+                    for zoom, block in work:
+                        if disp:
+                            print('Drawing tiles...(%d/%d)' % (tile_number, n_tiles), end='\r')
+                        tile_number += (block[1] - block[0]) * (block[3] - block[2])
+                        self.timer.pop()
+                        if pipeline is not None:
+                            images = self.render_block(*block, zoom, skip_blank, encode=False)
+                            pipeline.submit(zoom, block, images, self.timer.pop())
+                        else:
+                            tiles = self.render_block(*block, zoom, skip_blank)
+                            writer(zoom, block, tiles, self.timer.pop())
+                finally:
+                    if pipeline is not None:
+                        pipeline.close()
+
+            for zoom, block in sorted(pyramid_work, key=lambda work: -work[0]):
+                if disp:
+                    print('Drawing tiles...(%d/%d)' % (tile_number, n_tiles), end='\r')
+                tile_number += 1
+                self.timer.pop()
+                with self.timer('downsample'):
+                    image = self.downsample_tile(block[0], block[2], zoom, sink)
+                if image is None:
+                    if not plotted:
+                        self.create_figure(1, 1)
+                        self.plot()
+                        plotted = True
+                    self.timer.pop()
+                    tiles = self.render_block(*block, zoom, skip_blank)
+                    writer(zoom, block, tiles, self.timer.pop())
+                elif skip_blank and self.is_blank(image):
+                    writer(zoom, block, [], self.timer.pop())
+                else:
+                    with self.timer('encode'):
+                        data = self.encoder.encode(image)
+                    writer(zoom, block, [(block[0], block[2], data)], self.timer.pop())
+
+            if plotted and self.elevation is not None:
                 self.elevation.remove_contours()
 
-        if disp:
-            print()
+            summary = writer.close()
+            if stats is not None:
+                stats.finish()
 
-    def draw_tile(self, x, y, zoom, directory='tiles'):
+            if disp:
+                print()
+                print('Skipped %d blank tiles, %d duplicate tiles stored once' % (summary['blank'], summary['duplicates']))
+                if incremental:
+                    print('%d tiles unchanged, %d tiles deleted' % (summary['unchanged'], summary['deleted']))
+                if summary['resumed'] > 0:
+                    print('%d tiles already drawn according to the journal' % summary['resumed'])
+                if shard is not None and journal is not None:
+                    for i, (done, total) in enumerate(progress(journal_path, shard[1])):
+                        print('Shard %d/%d: %d/%d tiles' % (i, shard[1], done, total))
+                print(stats.report())
+
+            return summary
+        finally:
+            self.simplify = old_simplify
+            self.zoom = None # so the tolerance is set again for the restored simplification
+            self.batch = old_batch
+            self.declutter = old_declutter
+            self.metatile = old_metatile
+            self.set_coverage(old_coverage)
+
+    def plan_blocks(self, min, max, metatile=1, downsampled=(), shard=None):
         '''
-        Draw an individual map tile given by *x*, *y* and *zoom* (see `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_). The tiles are saved using `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_ within the parent directory *directory*.
+        Returns a list with the list of blocks (see :meth:`blocks`) of each zoom level from *min* (inclusive) to *max* (not inclusive) which are drawn by :meth:`draw_zoom_levels`. The blocks are *metatile* by *metatile* tiles, except for the zoom levels in *downsampled* which are built a tile at a time from the next zoom level. If *shard* is given as a tuple (i, n), only every n-th block of each zoom level is kept, starting from the i-th.
         '''
-        lat0, lon0 = num2deg(x, y, zoom)
-        lat1, lon1 = num2deg(x+1, y+1, zoom)
-        x0, y0 = self.projection(lat1, lon0)
-        x1, y1 = self.projection(lat0, lon1)
+        job = []
+        for zoom in range(min, max):
+            zoom_blocks = list(self.blocks(zoom, 1 if zoom in downsampled else metatile))
+            if shard is not None:
+                zoom_blocks = zoom_blocks[shard[0]::shard[1]]
+            job.append(zoom_blocks)
+        return job
 
-        self.axes.set_xlim(x0, x1)
-        self.axes.set_ylim(y0, y1)
+    def select_blocks(self, min, job, writer, downsampled=()):
+        '''
+        Returns the blocks of *job* (see :meth:`plan_blocks`), whose first zoom level is *min*, which need to be drawn, as a list of (zoom, block) tuples to draw from the features and a list to build from the next zoom level (the zoom levels in *downsampled*). Blocks already finished according to the journal of the :class:`.TileWriter` *writer* are counted as resumed and left out.
 
-        path = join(directory, '%d' % zoom)
-        try:
-            mkdir(path)
-        except FileExistsError:
-            pass
+        If the writer has a manifest, only the blocks with a tile whose fingerprint (see :meth:`tile_fingerprint`) has changed are kept and the changed tiles are added to the :attr:`.TileWriter.changes` of the writer. Tiles which no longer have anything drawn on them, or are no longer within the map, are deleted with :meth:`.TileWriter.delete`.
+        '''
+        manifest = writer.manifest
+        journal = writer.journal
+        changes = writer.changes
+        summary = writer.summary
+        work = []
+        pyramid_work = []
+        for zoom, zoom_blocks in enumerate(job, min):
+            if manifest is not None:
+                tiles = set(self.tiles(zoom))
+                for x, y in manifest.tiles(zoom):
+                    if (x, y) not in tiles:
+                        writer.delete(x, y, zoom)
 
-        path = join(path, '%d' % x)
-        try:
-            mkdir(path)
-        except FileExistsError:
-            pass
+            for block in zoom_blocks:
+                if journal is not None and (zoom,) + tuple(block) in journal:
+                    summary['resumed'] += (block[1] - block[0]) * (block[3] - block[2])
+                    continue
+                if manifest is not None:
+                    n_changes = len(changes)
+                    for x in range(block[0], block[1]):
+                        for y in range(block[2], block[3]):
+                            fingerprint = self.tile_fingerprint(x, y, zoom)
+                            if fingerprint is None:
+                                if manifest.get(x, y, zoom) is not None:
+                                    writer.delete(x, y, zoom)
+                            elif fingerprint == manifest.get(x, y, zoom):
+                                summary['unchanged'] += 1
+                            else:
+                                changes[(x, y, zoom)] = fingerprint
+                    if len(changes) == n_changes:
+                        continue
+                if zoom in downsampled:
+                    pyramid_work.append((zoom, block))
+                else:
+                    work.append((zoom, block))
+        return work, pyramid_work
 
-        path = join(path, '%d.png.tile' % y)
-        bbox = Bbox(np.array([[0,0], [1,1]]))
-        self.figure.savefig(path, format='png', dpi=256, bbox_inches=bbox)
+    def can_downsample(self, zoom):
+        '''
+        Check whether the tiles of `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* can be built by downsampling the tiles of the next zoom level. This is the case if the same features are visible at both zoom levels, the contours appear at neither or both, and none of the visible features has a style with *downsample* set to False. :meth:`build_index` must be called first.
+        '''
+        if np.any(np.logical_and(zoom < self.appears_at, self.appears_at <= zoom + 1)):
+            return False
+        if self.elevation is not None and zoom < self.elevation.style.contour_appears_at <= zoom + 1:
+            return False
+        for style in [feature.style for feature in self.features] + self.area_table.styles + self.way_table.styles + self.node_table.styles + self.name_table.styles:
+            if not style.downsample and style.appears_at <= zoom:
+                return False
+        return True
+
+    def downsample_tile(self, x, y, zoom, sink):
+        '''
+        Build the tile given by *x*, *y* and *zoom* from its four tiles at the next zoom level, which are read from the :class:`.TileSink` *sink*, and return it as an RGBA numpy array. Each pixel is the average of four pixels, weighted by their opacity. Tiles which are missing from the sink are assumed to be blank (see :meth:`is_blank`). Returns None if any of the four tiles is outside the map, so that the tile can be drawn from the features instead.
+        '''
+        x_start, x_stop, y_start, y_stop = self.tile_range(zoom + 1)
+        if 2*x < x_start or 2*x + 2 > x_stop or 2*y < y_start or 2*y + 2 > y_stop:
+            return None
+
+        image = np.empty((4, 512, 512), dtype=np.float32)
+        image[:] = self.blank_color()[:,np.newaxis,np.newaxis]
+        for i in range(2):
+            for j in range(2):
+                data = sink.read(2*x + i, 2*y + j, zoom + 1)
+                if data is not None:
+                    image[:,256*j:256*(j+1), 256*i:256*(i+1)] = self.encoder.decode(data).transpose(2, 0, 1)
+
+        image[:3] *= image[3]
+        image = image[:,0::2,0::2] + image[:,1::2,0::2] + image[:,0::2,1::2] + image[:,1::2,1::2]
+        np.divide(image[:3], image[3], out=image[:3], where=image[3] > 0)
+        image[3] /= 4
+        return np.ascontiguousarray(np.round(image).astype(np.uint8).transpose(1, 2, 0))
+
+    def render_block(self, x_start, x_stop, y_start, y_stop, zoom, skip_blank=False, encode=True):
+        '''
+        Draw the block of tiles from *x_start* to *x_stop* and *y_start* to *y_stop* (not inclusive) at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom*, using :meth:`render_tile` for a single tile and :meth:`render_metatile` otherwise. Returns a list of (x, y, data) tuples where *data* is the encoded image, or a copy of the RGBA numpy array if *encode* is False. If *skip_blank* is True, blank tiles are left out of the list.
+        '''
+        if x_stop - x_start == 1 and y_stop - y_start == 1:
+            data = self.render_tile(x_start, y_start, zoom, skip_blank, encode)
+            return [] if data is None else [(x_start, y_start, data)]
+        else:
+            return self.render_metatile(x_start, x_stop, y_start, y_stop, zoom, skip_blank, encode)
+
+    def render_tile(self, x, y, zoom, skip_blank=False, encode=True):
+        '''
+        Draw an individual map tile given by *x*, *y* and *zoom* (see `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_) and return it encoded by :attr:`encoder`, or as a copy of the RGBA numpy array if *encode* is False. Only the features near the tile are made visible, see :meth:`cull`. If *skip_blank* is True and the tile is blank, returns None.
+        '''
+        if self.zoom != zoom:
+            self.set_zoom(zoom)
+
+        if self.elevation is not None and self.elevation.tiled:
+            with self.timer('elevation'):
+                self.draw_elevation(x, x+1, y, y+1, zoom)
+        image = self.render(self.tile_bounds(x, x+1, y, y+1, zoom))
+        if skip_blank and self.is_blank(image):
+            return None
+        if not encode:
+            return image.copy()
+        with self.timer('encode'):
+            return self.encoder.encode(image)
+
+    def is_blank(self, image):
+        '''
+        Check whether the RGBA numpy array *image* only contains the background colour, or is completely transparent if there is no background.
+
+        See also :meth:`set_background_color`.
+        '''
+        return np.all(image == self.blank_color())
+
+    def blank_color(self):
+        '''
+        Returns the RGBA colour of a blank tile as a numpy array of integers from 0 to 255. This is the background colour, or transparent if there is no background.
+        '''
+        if self.background is None:
+            return np.zeros(4, dtype=np.uint8)
+        else:
+            return np.round(255*np.array(to_rgba(self.background.style.color))).astype(np.uint8)
+
+    def render_metatile(self, x_start, x_stop, y_start, y_stop, zoom, skip_blank=False, encode=True):
+        '''
+        Draw the block of tiles from *x_start* to *x_stop* and *y_start* to *y_stop* (not inclusive) at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* as a single image and slice it into individual tiles. This avoids the fixed cost of drawing each tile separately and names are not clipped at the edges of tiles within the block. Returns a list of (x, y, data) tuples where *data* is the tile encoded by :attr:`encoder`, or a copy of its RGBA numpy array if *encode* is False. If *skip_blank* is True, blank tiles are left out of the list.
+
+        The tiles are sliced from the image in equal parts, which assumes the projection is linear in tile indices as is the case for the default :meth:`projection`.
+        '''
+        if self.zoom != zoom:
+            self.set_zoom(zoom)
+
+        if self.elevation is not None and self.elevation.tiled:
+            with self.timer('elevation'):
+                self.draw_elevation(x_start, x_stop, y_start, y_stop, zoom)
+        bounds = self.tile_bounds(x_start, x_stop, y_start, y_stop, zoom)
+        image = self.render(bounds, x_stop - x_start, y_stop - y_start)
+
+        tiles = []
+        for i, x in enumerate(range(x_start, x_stop)):
+            for j, y in enumerate(range(y_start, y_stop)):
+                tile = image[256*j:256*(j+1), 256*i:256*(i+1)]
+                if skip_blank and self.is_blank(tile):
+                    continue
+                if not encode:
+                    tiles.append((x, y, tile.copy()))
+                    continue
+                with self.timer('encode'):
+                    tiles.append((x, y, self.encoder.encode(tile)))
+        return tiles
+
+    def draw_elevation(self, x_start, x_stop, y_start, y_stop, zoom):
+        '''
+        Draw the tiled elevation for the block of tiles from *x_start* to *x_stop* and *y_start* to *y_stop* (not inclusive) at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom*. The grids of the tiles from :meth:`.Elevation.tile_grid` are joined into one grid, including their overlap around the block, which is drawn by :meth:`.Elevation.draw_window`. The view is set to the block first since the contour labels are placed in pixels.
+        '''
+        bounds = self.tile_bounds(x_start, x_stop, y_start, y_stop, zoom)
+        self.set_view(bounds, x_stop - x_start, y_stop - y_start)
+
+        s = self.elevation.samples
+        p = self.elevation.overlap
+        ele = np.full(((x_stop - x_start)*s + 2*p, (y_stop - y_start)*s + 2*p), np.nan)
+        for x in range(x_start, x_stop):
+            for y in range(y_start, y_stop):
+                i = (x - x_start) * s
+                j = (y_stop - 1 - y) * s
+                ele[i:i+s+2*p, j:j+s+2*p] = self.elevation.tile_grid(x, y, zoom, self.tile_bounds(x, x+1, y, y+1, zoom))
+        self.elevation.draw_window(self.axes, ele, bounds, zoom >= self.elevation.style.contour_appears_at)
+
+    def draw_tile(self, x, y, zoom, directory='tiles', sink=None):
+        '''
+        Draw an individual map tile given by *x*, *y* and *zoom* (see `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_). The tiles are saved using `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_ within the parent directory *directory*, or written to the :class:`.TileSink` *sink* if given. Only the features near the tile are made visible, see :meth:`cull`.
+        '''
+        if sink is None:
+            sink = DirectorySink(directory, self.encoder.extension)
+        sink.set_format(self.encoder.format)
+        sink.write(x, y, zoom, self.render_tile(x, y, zoom))
+
+    def render(self, bounds, width=1, height=1):
+        '''
+        Draw the map within *bounds*, given in projected coordinates, on an image of *width* by *height* tiles and return the image as an RGBA numpy array of 256 pixels per tile. The array is a view of the canvas buffer so is only valid until the figure is drawn again. Only the features within *bounds* are made visible, see :meth:`cull`.
+        '''
+        with self.timer('cull'):
+            self.cull(bounds)
+        with self.timer('view'):
+            self.set_view(bounds, width, height)
+        with self.timer('draw'):
+            self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def set_view(self, bounds, width=1, height=1):
+        '''
+        Set the figure to *width* by *height* tiles of 256 pixels showing *bounds*, given in projected coordinates.
+        '''
+        self.figure.set_dpi(256)
+        self.figure.set_size_inches(width, height)
+        self.axes.set_xlim(*bounds[0])
+        self.axes.set_ylim(*bounds[1])
 
     def draw_image(self, filename='map.png', height=1024):
         '''
@@ -277,6 +1146,11 @@ class Map():
         self.plot()
 
         if self.elevation is not None:
+            if self.elevation.tiled:
+                if self.elevation.ele is None:
+                    self.elevation.generate_elevation_grid(self.bounds, self.elevation_resolution())
+                self.elevation.plot_relief(self.axes)
+            self.elevation.show_relief(self.bounds)
             self.elevation.plot_contours(self.axes)
 
         for area in self.areas:
@@ -291,8 +1165,33 @@ class Map():
         for name in self.names:
             name.set_visible(True)
 
+        for collection in self.collections:
+            collection.show(range(len(collection)))
+
+        for i in range(self.first_point, len(self.appears_at)):
+            self.set_visible(i, True)
+
         self.axes.set_xlim(self.bounds[0,0], self.bounds[0,1])
         self.axes.set_ylim(self.bounds[1,0], self.bounds[1,1])
 
         bbox = Bbox(np.array([[0,0], [1,1]]))
         self.figure.savefig(filename, dpi=height, bbox_inches=bbox)
+
+def _init_worker(map):
+    global _worker_map
+    _worker_map = map
+    _worker_map.create_figure(1, 1)
+    _worker_map.plot()
+
+def _render_blocks(args):
+    zoom, blocks, skip_blank = args
+    results = []
+    for block in blocks:
+        _worker_map.timer.pop()
+        tiles = _worker_map.render_block(*block, zoom, skip_blank)
+        results.append((block, tiles, _worker_map.timer.pop()))
+    return zoom, results
+
+def _render_tile(args):
+    x, y, zoom = args
+    return _worker_map.render_tile(x, y, zoom)
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from .stats import Timer
+
+class Pipeline():
+    '''
+    Encodes and stores drawn tiles in background threads so that the next block of tiles can be drawn while the last one is encoded and written. The raw images of each block are passed to :meth:`submit`, encoded by *threads* threads with *encoder* (an :class:`.Encoder`, whose compression releases the GIL) and then passed to *store* one block at a time by a single writer thread, so *store* and the sink it writes to do not need to be thread safe. Since *store* runs on the writer thread, so do any callbacks it makes, e.g. the *callback* of a :class:`.Stats` and the journal updates of a :class:`.TileWriter`.
+
+    At most *depth* blocks (by default twice the number of threads) are held by the pipeline at once, after which :meth:`submit` waits for a block to be written, so the memory used stays bounded however slow the encoding or writing is. The pipeline must be closed with :meth:`close`, which waits for all the blocks to be written and raises the first error from encoding or storing a block, if any.
+    '''
+    def __init__(self, encoder, store, threads=2, depth=None):
+        self.encoder = encoder
+        self.store = store
+        self.encoders = ThreadPoolExecutor(threads)
+        self.writer = ThreadPoolExecutor(1)
+        self.slots = BoundedSemaphore(2*threads if depth is None else depth)
+        self.errors = []
+        self.lock = Lock()
+
+    def submit(self, zoom, block, images, times=None):
+        '''
+        Queue the list of (x, y, image) tuples *images* of *block* at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *zoom* to be encoded and stored, waiting first if the pipeline is full. The images must not be changed afterwards, so should be copies of the canvas buffer. *times* is the dictionary of stage times of the block, to which the encode time is added.
+        '''
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        self.slots.acquire()
+        self.encoders.submit(self.encode, zoom, block, images, {} if times is None else times)
+
+    def encode(self, zoom, block, images, times):
+        '''
+        Encode the *images* of *block* on one of the encoding threads, add the encode time to *times* and pass the encoded tiles to the writer thread with :meth:`write`. An error is kept to be raised by :meth:`submit` or :meth:`close`.
+        '''
+        try:
+            timer = Timer()
+            with timer('encode'):
+                tiles = [(x, y, self.encoder.encode(image)) for x, y, image in images]
+            for stage, seconds in timer.pop().items():
+                times[stage] = times.get(stage, 0.0) + seconds
+            self.writer.submit(self.write, zoom, block, tiles, times)
+        except Exception as error:
+            self.fail(error)
+            self.slots.release()
+
+    def write(self, zoom, block, tiles, times):
+        '''
+        Pass the encoded *tiles* of *block* to *store* on the writer thread and free the slot of the block. Everything *store* calls, such as the :class:`.Stats` callback and :meth:`.Journal.add` from a :class:`.TileWriter`, runs on this thread rather than the thread which called :meth:`submit`, one block at a time.
+        '''
+        try:
+            self.store(zoom, block, tiles, times)
+        except Exception as error:
+            self.fail(error)
+        finally:
+            self.slots.release()
+
+    def fail(self, error):
+        with self.lock:
+            self.errors.append(error)
+
+    def close(self):
+        '''
+        Wait for all the queued blocks to be encoded and stored and stop the threads.
+        '''
+        self.encoders.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+        if len(self.errors) > 0:
+            raise self.errors[0]
@@ -20,20 +20,49 @@ def inverse_mercator(x, y):
 
 def deg2num(lat_deg, lon_deg, zoom):
     '''
-    Return the OpenStreetMap tile that contains the given lat/lon point. The function is copied from the `OpenStreetMap wiki <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python>`_ but uses numpy rather than the builtin math library.
+    Return the OpenStreetMap tile that contains the given lat/lon point. The function is copied from the `OpenStreetMap wiki <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python>`_ but uses numpy rather than the builtin math library. The coordinates can also be numpy arrays, in which case the tile indices are returned as arrays of integers.
     '''
     lat_rad = np.deg2rad(lat_deg)
     n = 2.0 ** zoom
-    xtile = int((lon_deg + 180.0) / 360.0 * n)
-    ytile = int((1.0 - np.log(np.tan(lat_rad) + (1 / np.cos(lat_rad))) / np.pi) / 2.0 * n)
+    xtile = np.trunc((np.asarray(lon_deg) + 180.0) / 360.0 * n).astype(np.int64)
+    ytile = np.trunc((1.0 - np.log(np.tan(lat_rad) + (1 / np.cos(lat_rad))) / np.pi) / 2.0 * n).astype(np.int64)
+    if np.ndim(xtile) == 0 and np.ndim(ytile) == 0:
+        return int(xtile), int(ytile)
     return xtile, ytile
 
 def num2deg(xtile, ytile, zoom):
     '''
-    Return the lat/lon coordinates of the top left (NW) corner of the OpenStreetMap tile. The function is copied from the `OpenStreetMap wiki <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python>`_ but uses numpy rather than the builtin math library.
+    Return the lat/lon coordinates of the top left (NW) corner of the OpenStreetMap tile. The function is copied from the `OpenStreetMap wiki <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python>`_ but uses numpy rather than the builtin math library. The tile indices can also be numpy arrays.
     '''
     n = 2.0 ** zoom
     lon_deg = xtile / n * 360.0 - 180.0
     lat_rad = np.arctan(np.sinh(np.pi * (1 - 2 * ytile / n)))
     lat_deg = np.rad2deg(lat_rad)
     return lat_deg, lon_deg
+
+def tile_range(top, bottom, left, right, zoom):
+    '''
+    Return the range of OpenStreetMap tiles at *zoom* that contain the lat/lon box with edges *top*, *bottom*, *left* and *right* as a tuple (x_start, x_stop, y_start, y_stop), where the stop indices are not inclusive. A box which ends on the edge of a tile, such as one from :meth:`.Map.bound_by_osm_tiles`, does not include the tiles beyond that edge.
+    '''
+    x_start, y_start = deg2num(top, left, zoom)
+    x_stop, y_stop = deg2num(bottom, right, zoom)
+    return x_start, x_stop, y_start, y_stop
+
+def tile_cover(x_start, x_stop, y_start, y_stop):
+    '''
+    Return every tile in the range from *x_start* to *x_stop* and *y_start* to *y_stop* (not inclusive) as a (2,N) numpy array of x and y indices, sorted by x and then y.
+    '''
+    x, y = np.meshgrid(np.arange(x_start, x_stop, dtype=np.int64), np.arange(y_start, y_stop, dtype=np.int64), indexing='ij')
+    return np.array([x.reshape(-1), y.reshape(-1)])
+
+def tile_extents(xtiles, ytiles, zoom, projection=mercator):
+    '''
+    Return the bounds of the OpenStreetMap tiles with indices *xtiles* and *ytiles* at *zoom* as an (N,4) numpy array of the minimum x, maximum x, minimum y and maximum y coordinates of each tile after *projection*, which takes latitudes and longitudes as for :func:`mercator`. All the tiles are projected at once.
+    '''
+    xtiles = np.asarray(xtiles).reshape(-1)
+    ytiles = np.asarray(ytiles).reshape(-1)
+    lat0, lon0 = num2deg(xtiles, ytiles, zoom)
+    lat1, lon1 = num2deg(xtiles + 1, ytiles + 1, zoom)
+    x, y = projection(np.concatenate([lat1, lat0]), np.concatenate([lon0, lon1]))
+    n = len(xtiles)
+    return np.array([x[:n], x[n:], y[:n], y[n:]]).T
@@ -0,0 +1,228 @@
+'''
+Serve the tiles of a map over HTTP, drawing each tile the first time it is requested rather than drawing every zoom level in advance. The map is loaded from a file written with :mod:`pickle`, e.g.
+
+::
+
+  with open('map.pickle', 'wb') as f:
+      pickle.dump(map, f)
+
+and served with
+
+::
+
+  python -m cartograph.serve map.pickle --port 8000 --workers 4 --cache-directory tiles
+
+The tiles are then at http://localhost:8000/zoom/x/y.png, using `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_.
+'''
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
+from threading import Lock
+from concurrent.futures import Future
+from multiprocessing import Pool
+from argparse import ArgumentParser
+import pickle
+from os import makedirs
+from .map import _init_worker, _render_tile
+from .sink import DirectorySink
+
+class TileCache():
+    '''
+    In-memory cache of encoded tiles which holds at most *max_bytes* of tile data, discarding the least recently used tiles first. It is safe to use from several threads.
+    '''
+    def __init__(self, max_bytes=64*2**20):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get(self, x, y, zoom):
+        '''
+        Return the encoded tile given by *x*, *y* and *zoom*, or None if it is not in the cache.
+        '''
+        with self.lock:
+            data = self.tiles.get((x, y, zoom))
+            if data is not None:
+                self.tiles.move_to_end((x, y, zoom))
+            return data
+
+    def put(self, x, y, zoom, data):
+        '''
+        Add the encoded tile *data*, discarding the least recently used tiles until the cache is within :attr:`max_bytes`. Tiles larger than :attr:`max_bytes` are not kept.
+        '''
+        with self.lock:
+            if (x, y, zoom) in self.tiles:
+                self.size -= len(self.tiles.pop((x, y, zoom)))
+            if len(data) > self.max_bytes:
+                return
+            self.tiles[(x, y, zoom)] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.size -= len(self.tiles.popitem(last=False)[1])
+
+class TileServer():
+    '''
+    Draws the tiles of the :class:`.Map` *map* on demand. Tiles are drawn by *workers* processes, each of which plots its own copy of the map once as for :meth:`.Map.draw_zoom_levels`, so different tiles are drawn in parallel. Each process keeps the contours of its last few zoom levels (see :meth:`.Elevation.plot_contour_layer`), so requests for tiles of different zoom levels do not plot them again each time. Requests for a tile which is already being drawn wait for the same drawing rather than drawing it again.
+
+    Drawn tiles are kept in a :class:`TileCache` of *cache_bytes* and, if *cache_directory* is given, saved there as for :class:`.DirectorySink` so they are not drawn again when the server is restarted. The tiles in *cache_directory* are not checked against the map, so the directory should be cleared when the map changes.
+
+    Only the tiles within the bounds of the map and from *min_zoom* to *max_zoom* (inclusive) are drawn. The server should be closed with :meth:`close` or used as a context manager.
+    '''
+    def __init__(self, map, workers=1, cache_bytes=64*2**20, cache_directory=None, min_zoom=0, max_zoom=19):
+        self.map = map
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cache = TileCache(cache_bytes)
+        self.sink = None
+        if cache_directory is not None:
+            makedirs(cache_directory, exist_ok=True)
+            self.sink = DirectorySink(cache_directory, map.encoder.extension)
+        self.pending = {}
+        self.lock = Lock()
+        self.counts = {'memory':0, 'disk':0, 'drawn':0, 'coalesced':0}
+
+        if map.elevation is not None and not map.elevation.tiled:
+            map.elevation.relief()
+        self.pool = Pool(workers, initializer=_init_worker, initargs=(map,))
+
+    def close(self):
+        '''
+        Stop the worker processes.
+        '''
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def contains(self, x, y, zoom):
+        '''
+        Check whether the tile given by *x*, *y* and *zoom* is within the bounds of the map and the zoom levels served.
+        '''
+        if zoom < self.min_zoom or zoom > self.max_zoom:
+            return False
+        x_start, x_stop, y_start, y_stop = self.map.tile_range(zoom)
+        return x_start <= x < x_stop and y_start <= y < y_stop
+
+    def get(self, x, y, zoom):
+        '''
+        Return the encoded tile given by *x*, *y* and *zoom*, from the memory cache, the cache directory or by drawing it, or None if the tile is not served (see :meth:`contains`).
+        '''
+        if not self.contains(x, y, zoom):
+            return None
+        data = self.cache.get(x, y, zoom)
+        if data is not None:
+            self.count('memory')
+            return data
+
+        with self.lock:
+            future = self.pending.get((x, y, zoom))
+            owner = future is None
+            if owner:
+                data = self.cache.get(x, y, zoom)
+                if data is not None:
+                    self.counts['memory'] += 1
+                    return data
+                future = Future()
+                self.pending[(x, y, zoom)] = future
+                future.set_running_or_notify_cancel()
+            else:
+                self.counts['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            data = None if self.sink is None else self.sink.read(x, y, zoom)
+            if data is not None:
+                self.count('disk')
+            else:
+                data = self.pool.apply(_render_tile, ((x, y, zoom),))
+                self.count('drawn')
+                if self.sink is not None:
+                    self.sink.write(x, y, zoom, data)
+            self.cache.put(x, y, zoom, data)
+            future.set_result(data)
+            return data
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop((x, y, zoom))
+
+    def count(self, name):
+        '''
+        Add one to the count *name* of :attr:`counts`, the number of tiles served from memory, from disk, drawn or waiting on another request.
+        '''
+        with self.lock:
+            self.counts[name] += 1
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handles GET requests for zoom/x/y tiles (with any extension) from the :class:`TileServer` :attr:`tiles` of the HTTP server. Tiles which are not served get a 404 response and tiles which fail to draw a 500 response.
+    '''
+    content_types = {'png':'image/png', 'webp':'image/webp', 'jpeg':'image/jpeg'}
+
+    def do_GET(self):
+        try:
+            zoom, x, y = self.path.split('?')[0].strip('/').split('/')
+            zoom, x, y = int(zoom), int(x), int(y.split('.')[0])
+        except ValueError:
+            self.send_error(404)
+            return
+
+        try:
+            data = self.server.tiles.get(x, y, zoom)
+        except Exception as error:
+            self.log_error('Drawing tile %d/%d/%d failed: %r', zoom, x, y, error)
+            self.send_error(500)
+            return
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', self.content_types[self.server.tiles.map.encoder.format])
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def serve(map, host='localhost', port=8000, verbose=False, **options):
+    '''
+    Serve the tiles of the :class:`.Map` *map* at http://*host*:*port*/zoom/x/y.png until interrupted. The *options* are passed to :class:`TileServer`. Requests are logged if *verbose* is True.
+    '''
+    with TileServer(map, **options) as tiles:
+        httpd = ThreadingHTTPServer((host, port), TileRequestHandler)
+        httpd.tiles = tiles
+        httpd.verbose = verbose
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve the tiles of a pickled map, drawing them on demand.')
+    parser.add_argument('map', help='file of the map written with pickle')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help='number of processes drawing tiles')
+    parser.add_argument('--cache-bytes', type=int, default=64*2**20, help='size of the in-memory tile cache')
+    parser.add_argument('--cache-directory', help='directory to save the drawn tiles in')
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=19)
+    parser.add_argument('--verbose', action='store_true', help='log each request')
+    args = parser.parse_args()
+
+    with open(args.map, 'rb') as f:
+        map = pickle.load(f)
+    serve(map, args.host, args.port, args.verbose, workers=args.workers, cache_bytes=args.cache_bytes, cache_directory=args.cache_directory, min_zoom=args.min_zoom, max_zoom=args.max_zoom)
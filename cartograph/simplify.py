@@ -0,0 +1,47 @@
+import numpy as np
+
+def douglas_peucker(points, tolerance):
+    '''
+    Simplify the line through the (2,N) numpy array *points* using the `Ramer-Douglas-Peucker algorithm <https://en.wikipedia.org/wiki/Ramer%E2%80%93Douglas%E2%80%93Peucker_algorithm>`_, keeping the vertices that are further than *tolerance* from the simplified line. The first and last vertices are always kept, so closed boundaries stay closed. Returns the simplified (2,M) numpy array.
+
+    Rather than recursing into one part of the line at a time, each iteration splits every part of the line at its furthest vertex at once, so the number of iterations is the depth of the recursion. Vertices in parts which are already within *tolerance* are not visited again.
+    '''
+    n = points.shape[1]
+    if n < 3:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = True
+    keep[-1] = True
+    active = np.ones(n, dtype=bool)
+    while True:
+        kept = np.flatnonzero(keep)
+        part = np.minimum(np.cumsum(keep) - 1, len(kept) - 2)
+        vertices = np.flatnonzero(np.logical_and(active, np.logical_not(keep)))
+        if len(vertices) == 0:
+            break
+        part = part[vertices]
+        start = points[:,kept[part]]
+        stop = points[:,kept[part+1]]
+
+        dx, dy = stop - start
+        x, y = points[:,vertices] - start
+        length = np.hypot(dx, dy)
+        distance = np.hypot(x, y)
+        chord = length > 0
+        distance[chord] = np.abs(x[chord]*dy[chord] - y[chord]*dx[chord]) / length[chord]
+
+        new_part = np.ones(len(vertices), dtype=bool)
+        new_part[1:] = part[1:] != part[:-1]
+        group = np.cumsum(new_part) - 1
+        furthest = np.maximum.reduceat(distance, np.flatnonzero(new_part))
+        candidates = np.flatnonzero(np.logical_and(distance == furthest[group], distance > tolerance))
+        if len(candidates) == 0:
+            break
+
+        groups, first = np.unique(group[candidates], return_index=True)
+        split = np.zeros(len(furthest), dtype=bool)
+        split[groups] = True
+        active[vertices] = split[group]
+        keep[vertices[candidates[first]]] = True
+    return points[:,keep]
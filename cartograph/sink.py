@@ -0,0 +1,310 @@
+from os import mkdir, makedirs, remove, replace, link, symlink
+from os.path import join, dirname, relpath, exists
+from hashlib import sha1
+import sqlite3
+from .stats import Timer
+
+class TileSink():
+    '''
+    Generic destination for drawn tiles. Subclasses must override :meth:`write` and can override :meth:`flush` and :meth:`close`. A sink can be used as a context manager, in which case it is closed on exit.
+
+    Sinks that store identical tiles only once count the number of repeated tiles in :attr:`duplicates`. The :attr:`manifest_path` is where the :class:`.Manifest` of the tiles is kept when drawing incrementally.
+    '''
+    duplicates = 0
+    manifest_path = None
+
+    def write(self, x, y, zoom, data):
+        '''
+        Store the encoded image *data* (bytes) of the tile given by *x*, *y* and *zoom* (see `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_).
+        '''
+        raise NotImplementedError
+
+    def read(self, x, y, zoom):
+        '''
+        Return the encoded image of the tile given by *x*, *y* and *zoom*, or None if it is not stored.
+        '''
+        raise NotImplementedError
+
+    def delete(self, x, y, zoom):
+        '''
+        Remove the tile given by *x*, *y* and *zoom* if it is stored.
+        '''
+        raise NotImplementedError
+
+    def set_format(self, format):
+        '''
+        Record the *format* of the encoded tiles ('png', 'webp' or 'jpeg'), called by :meth:`.Map.draw_zoom_levels` before writing. By default it does nothing.
+        '''
+        pass
+
+    def flush(self):
+        '''
+        Make sure all the tiles written so far are stored. By default it does nothing.
+        '''
+        pass
+
+    def close(self):
+        '''
+        Flush and release any resources held by the sink.
+        '''
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class DirectorySink(TileSink):
+    '''
+    Subclass of :class:`TileSink`
+
+    Saves each tile as a separate file using `slippy map tilenames <https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames>`_ within the parent directory *directory*, i.e. as *directory*/zoom/x/y. *extension* is appended to the file names. This is the default sink.
+
+    If *link* is 'hard' or 'symbolic', each distinct tile image is saved once in the .blobs directory within *directory*, named by a hash of its contents, and the tiles are saved as hard or symbolic links to it rather than copies. Since the images are never rewritten, writing or deleting one tile never changes another. Images which are no longer used by any tile are not removed.
+    '''
+    def __init__(self, directory='tiles', extension='.png.tile', link=None):
+        if link not in (None, 'hard', 'symbolic'):
+            raise ValueError('link must be None, \'hard\' or \'symbolic\'')
+        self.directory = directory
+        self.extension = extension
+        self.link = link
+        self.blob_ids = set()
+        self.duplicates = 0
+        self.manifest_path = join(directory, 'manifest.json')
+
+    def path(self, x, y, zoom):
+        '''
+        Returns the path of the tile given by *x*, *y* and *zoom*, creating the zoom and x directories if they do not exist.
+        '''
+        path = join(self.directory, '%d' % zoom)
+        try:
+            mkdir(path)
+        except FileExistsError:
+            pass
+
+        path = join(path, '%d' % x)
+        try:
+            mkdir(path)
+        except FileExistsError:
+            pass
+
+        return join(path, '%d%s' % (y, self.extension))
+
+    def write(self, x, y, zoom, data):
+        '''
+        Save the tile to its file, replacing any existing tile. Existing files are removed rather than overwritten since they may be links to a shared image.
+        '''
+        path = self.path(x, y, zoom)
+        try:
+            remove(path)
+        except FileNotFoundError:
+            pass
+
+        if self.link is not None:
+            blob = self.blob_path(data)
+            if not exists(blob):
+                with open(blob + '.tmp', 'wb') as f:
+                    f.write(data)
+                replace(blob + '.tmp', blob)
+            if self.link == 'hard':
+                link(blob, path)
+            else:
+                symlink(relpath(blob, dirname(path)), path)
+            return
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def blob_path(self, data):
+        '''
+        Returns the path in the .blobs directory of the image *data* when saving tiles as links, counting it in :attr:`duplicates` if it has already been written by this sink.
+        '''
+        tile_id = sha1(data).hexdigest()
+        if tile_id in self.blob_ids:
+            self.duplicates += 1
+        self.blob_ids.add(tile_id)
+        directory = join(self.directory, '.blobs')
+        makedirs(directory, exist_ok=True)
+        return join(directory, tile_id + self.extension)
+
+    def read(self, x, y, zoom):
+        '''
+        Return the contents of the file of the tile, or None if it does not exist.
+        '''
+        try:
+            with open(join(self.directory, '%d' % zoom, '%d' % x, '%d%s' % (y, self.extension)), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, x, y, zoom):
+        '''
+        Remove the file of the tile if it exists.
+        '''
+        try:
+            remove(join(self.directory, '%d' % zoom, '%d' % x, '%d%s' % (y, self.extension)))
+        except FileNotFoundError:
+            pass
+
+class MBTilesSink(TileSink):
+    '''
+    Subclass of :class:`TileSink`
+
+    Stores the tiles in the SQLite database *filename* using the `MBTiles <https://github.com/mapbox/mbtiles-spec>`_ format. The images are stored in an images table keyed by a hash of the image data, with a map table from tile coordinates to images, so identical tiles are only stored once. Tiles are inserted in transactions of *batch_size* tiles. Any *metadata* (e.g. name, format, bounds, minzoom, maxzoom) is written to the metadata table. The sink can be used from a thread other than the one which created it, such as the writer thread of a :class:`.Pipeline`, but not from several threads at once.
+
+    Note that MBTiles uses the `TMS <https://wiki.openstreetmap.org/wiki/TMS>`_ tile row, so the y index is flipped relative to slippy map tilenames.
+    '''
+    def __init__(self, filename, batch_size=1000, **metadata):
+        self.filename = filename
+        self.manifest_path = filename + '.manifest.json'
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)')
+            self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS images (tile_data BLOB, tile_id TEXT)')
+            self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS images_id ON images (tile_id)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT)')
+            self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS map_index ON map (zoom_level, tile_column, tile_row)')
+            self.connection.execute('CREATE VIEW IF NOT EXISTS tiles AS SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row, images.tile_data AS tile_data FROM map JOIN images ON images.tile_id = map.tile_id')
+        self.update_metadata(**{'name':'cartograph', 'format':'png', **metadata})
+        self.images = []
+        self.tiles = []
+        self.deleted = []
+        self.tile_ids = set()
+        self.duplicates = 0
+
+    def set_format(self, format):
+        '''
+        Set the format in the metadata table, where JPEG is written as 'jpg' as in the MBTiles specification.
+        '''
+        self.update_metadata(format={'jpeg':'jpg'}.get(format, format))
+
+    def update_metadata(self, **metadata):
+        '''
+        Set values in the metadata table.
+        '''
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)', [(name, str(value)) for name, value in metadata.items()])
+
+    def write(self, x, y, zoom, data):
+        '''
+        Queue the tile for insertion, inserting the queued tiles if there are at least *batch_size* of them. The image is only queued if it has not already been written by this sink.
+        '''
+        tile_id = sha1(data).hexdigest()
+        if tile_id in self.tile_ids:
+            self.duplicates += 1
+        else:
+            self.tile_ids.add(tile_id)
+            self.images.append((data, tile_id))
+        self.tiles.append((zoom, x, 2**zoom - 1 - y, tile_id))
+        if len(self.tiles) >= self.batch_size:
+            self.flush()
+
+    def read(self, x, y, zoom):
+        '''
+        Return the image of the tile, or None if it is not stored. Any queued tiles are inserted first.
+        '''
+        if len(self.tiles) > 0 or len(self.deleted) > 0:
+            self.flush()
+        row = self.connection.execute('SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', (zoom, x, 2**zoom - 1 - y)).fetchone()
+        return None if row is None else row[0]
+
+    def delete(self, x, y, zoom):
+        '''
+        Queue the tile for removal from the map table. Images which are no longer used are not removed.
+        '''
+        self.deleted.append((zoom, x, 2**zoom - 1 - y))
+        if len(self.deleted) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Insert and remove the queued tiles in a single transaction.
+        '''
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO images (tile_data, tile_id) VALUES (?, ?)', self.images)
+            self.connection.executemany('INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)', self.tiles)
+            self.connection.executemany('DELETE FROM map WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', self.deleted)
+        self.images = []
+        self.tiles = []
+        self.deleted = []
+
+    def close(self):
+        '''
+        Insert the queued tiles and close the database.
+        '''
+        self.flush()
+        self.connection.close()
+
+class TileWriter():
+    '''
+    Stores the tiles drawn by :meth:`.Map.draw_zoom_levels` in the :class:`TileSink` *sink* one block at a time and counts the tiles drawn, the blank tiles and the deleted tiles in :attr:`summary`. A writer is called with each block as ``writer(zoom, block, tiles, times)``, e.g. by a :class:`.Pipeline`, where *tiles* is the list of (x, y, data) tuples of the block which are not blank. The tiles of the block which are blank are deleted from the sink, so that a tile drawn before is not left in place of a blank one.
+
+    If a :class:`.Manifest` *manifest* is given, the tiles are drawn incrementally: :attr:`changes` is a dictionary from each (x, y, zoom) tile to draw to its new fingerprint, only those tiles are written or deleted and their fingerprints are set in the manifest. Each block is recorded in the :class:`.Stats` *stats* and the :class:`.Journal` *journal* if they are given, in which case the sink is flushed and the manifest and journal are saved every *checkpoint* blocks.
+    '''
+    def __init__(self, sink, manifest=None, journal=None, stats=None, checkpoint=100):
+        self.sink = sink
+        self.manifest = manifest
+        self.journal = journal
+        self.stats = stats
+        self.checkpoint = checkpoint
+        self.changes = None if manifest is None else {}
+        self.duplicates = sink.duplicates
+        self.summary = {'tiles':0, 'blank':0, 'duplicates':0, 'unchanged':0, 'deleted':0, 'resumed':0}
+
+    def __call__(self, zoom, block, tiles, times=None):
+        drawn = set()
+        written = 0
+        timer = Timer()
+        for x, y, data in tiles:
+            if self.changes is None or (x, y, zoom) in self.changes:
+                with timer('write'):
+                    self.sink.write(x, y, zoom, data)
+                drawn.add((x, y))
+                written += len(data)
+        for x in range(block[0], block[1]):
+            for y in range(block[2], block[3]):
+                if self.changes is None or (x, y, zoom) in self.changes:
+                    if (x, y) not in drawn:
+                        self.summary['blank'] += 1
+                        self.sink.delete(x, y, zoom)
+                    if self.manifest is not None:
+                        self.manifest.set(x, y, zoom, self.changes[(x, y, zoom)])
+        self.summary['tiles'] += len(drawn)
+        if self.stats is not None:
+            record = {'zoom':zoom, 'x':block[0], 'y':block[2], 'tiles':(block[1] - block[0]) * (block[3] - block[2]), 'bytes':written}
+            record.update(times or {})
+            record.update(timer.pop())
+            self.stats.record(record)
+        if self.journal is not None:
+            self.journal.add(zoom, block)
+            if len(self.journal.new) >= self.checkpoint:
+                self.save()
+
+    def delete(self, x, y, zoom):
+        '''
+        Delete the tile given by *x*, *y* and *zoom* from the sink and the manifest and count it as deleted.
+        '''
+        self.sink.delete(x, y, zoom)
+        self.manifest.remove(x, y, zoom)
+        self.summary['deleted'] += 1
+
+    def save(self):
+        '''
+        Flush the sink and save the manifest and the journal, if any.
+        '''
+        self.sink.flush()
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.journal is not None:
+            self.journal.save()
+
+    def close(self):
+        '''
+        :meth:`save` the tiles written and return the :attr:`summary`, with the number of tiles stored once by the sink as duplicates.
+        '''
+        self.save()
+        self.summary['duplicates'] = self.sink.duplicates - self.duplicates
+        return self.summary
@@ -0,0 +1,126 @@
+from time import perf_counter
+from contextlib import contextmanager
+import numpy as np
+
+STAGES = ('elevation', 'cull', 'view', 'draw', 'downsample', 'encode', 'write')
+
+class Timer():
+    '''
+    Accumulates the time spent in each stage of drawing a block of tiles, see :data:`STAGES`, and counts such as the number of visible features. The stages are timed with ``with timer('draw'):`` and the totals are collected with :meth:`pop`.
+    '''
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] = self.times.get(stage, 0.0) + perf_counter() - start
+
+    def count(self, name, n):
+        '''
+        Add *n* to the count *name*.
+        '''
+        self.times[name] = self.times.get(name, 0) + n
+
+    def pop(self):
+        '''
+        Return the dictionary of the time in seconds spent in each stage and the counts since the last call and start again.
+        '''
+        times = self.times
+        self.times = {}
+        return times
+
+class Stats():
+    '''
+    Collects timings and counts while drawing tiles with :meth:`.Map.draw_zoom_levels`. A record is added by :meth:`record` for each block of tiles drawn (a single tile unless drawing metatiles), with the zoom level, the x and y index of the first tile of the block, the number of tiles, the seconds spent in each of :data:`STAGES`, the number of visible features (*artists*) and the number of bytes written. If *callback* is given, it is called with each record as it is added, e.g. to log slow tiles as they happen.
+
+    At the end of drawing :meth:`finish` is called, which calls *zoom_callback*, if given, with each zoom level and its summary (see :meth:`zooms`). :meth:`summary` and :meth:`report` give the totals, the tiles per second and the 50th and 99th percentile of the time per tile.
+    '''
+    def __init__(self, callback=None, zoom_callback=None):
+        self.callback = callback
+        self.zoom_callback = zoom_callback
+        self.records = []
+        self.start = None
+        self.stop = None
+
+    def begin(self):
+        '''
+        Start timing, called at the start of :meth:`.Map.draw_zoom_levels`.
+        '''
+        self.start = perf_counter()
+        self.stop = None
+
+    def record(self, record):
+        '''
+        Add the dictionary *record* for a block of tiles.
+        '''
+        record['seconds'] = sum(record.get(stage, 0.0) for stage in STAGES)
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def finish(self):
+        '''
+        Stop timing and pass the summary of each zoom level to *zoom_callback*, called at the end of :meth:`.Map.draw_zoom_levels`.
+        '''
+        self.stop = perf_counter()
+        if self.zoom_callback is not None:
+            for zoom, summary in self.zooms().items():
+                self.zoom_callback(zoom, summary)
+
+    def latencies(self, records=None):
+        '''
+        Return the time in seconds taken by each tile of *records* (by default all the records) as a numpy array, where the time of a block is shared equally between its tiles.
+        '''
+        if records is None:
+            records = self.records
+        seconds = np.array([record['seconds'] for record in records], dtype=float)
+        tiles = np.array([record['tiles'] for record in records], dtype=int)
+        return np.repeat(seconds / np.maximum(tiles, 1), tiles)
+
+    def aggregate(self, records, seconds=None):
+        '''
+        Return a dictionary of the number of tiles, blocks, visible features and bytes written in *records*, the seconds spent in each stage, the tiles per second and the 50th and 99th percentile time per tile. The tiles per second are over the wall clock *seconds* if given, otherwise over the total time of the records.
+        '''
+        latencies = self.latencies(records)
+        summary = {'tiles':len(latencies), 'blocks':len(records), 'artists':sum(record.get('artists', 0) for record in records), 'bytes':sum(record.get('bytes', 0) for record in records)}
+        summary['stages'] = {stage:sum(record.get(stage, 0.0) for record in records) for stage in STAGES if any(stage in record for record in records)}
+        if seconds is None:
+            seconds = sum(record['seconds'] for record in records)
+        summary['seconds'] = seconds
+        summary['tiles_per_second'] = len(latencies) / seconds if seconds > 0 else 0.0
+        summary['p50'] = float(np.percentile(latencies, 50)) if len(latencies) > 0 else 0.0
+        summary['p99'] = float(np.percentile(latencies, 99)) if len(latencies) > 0 else 0.0
+        return summary
+
+    def zooms(self):
+        '''
+        Return a dictionary from each zoom level to the :meth:`aggregate` of its records.
+        '''
+        zooms = {}
+        for record in self.records:
+            zooms.setdefault(record['zoom'], []).append(record)
+        return {zoom:self.aggregate(records) for zoom, records in sorted(zooms.items())}
+
+    def summary(self):
+        '''
+        Return the :meth:`aggregate` of all the records over the wall clock time of drawing, with the summary of each zoom level under 'zooms'. When drawing in parallel, the stage times are added up over the processes so can be more than the wall clock time.
+        '''
+        stop = self.stop if self.stop is not None else perf_counter()
+        summary = self.aggregate(self.records, None if self.start is None else stop - self.start)
+        summary['zooms'] = self.zooms()
+        return summary
+
+    def report(self):
+        '''
+        Return a text report of the :meth:`summary`, with a line for each zoom level.
+        '''
+        summary = self.summary()
+        lines = ['%d tiles in %.2f s (%.1f tiles/s), p50 %.1f ms, p99 %.1f ms, %d bytes written' % (summary['tiles'], summary['seconds'], summary['tiles_per_second'], 1000*summary['p50'], 1000*summary['p99'], summary['bytes'])]
+        lines.append('stages: ' + ', '.join('%s %.2f s' % (stage, seconds) for stage, seconds in summary['stages'].items()))
+        for zoom, zoom_summary in summary['zooms'].items():
+            lines.append('zoom %d: %d tiles, %.1f tiles/s, p50 %.1f ms, p99 %.1f ms, %.1f features/block' % (zoom, zoom_summary['tiles'], zoom_summary['tiles_per_second'], 1000*zoom_summary['p50'], 1000*zoom_summary['p99'], zoom_summary['artists'] / max(zoom_summary['blocks'], 1)))
+        return '\n'.join(lines)
@@ -0,0 +1,259 @@
+from hashlib import sha1
+import numpy as np
+from .feature import AreaCollection, WayCollection
+from .style import style_fingerprint
+
+class Table():
+    '''
+    Generic columnar store of features. The style of feature i is :attr:`styles`\\ [:attr:`style_ids`\\ [i]]. Subclasses set the feature name used in the fingerprints.
+    '''
+    name = None
+
+    def __init__(self):
+        self.styles = []
+        self.style_numbers = {}
+
+    def add_style(self, style):
+        '''
+        Returns the index of *style* in :attr:`styles`, adding it if it is not already there. Styles are compared by identity.
+        '''
+        if id(style) not in self.style_numbers:
+            self.style_numbers[id(style)] = len(self.styles)
+            self.styles.append(style)
+        return self.style_numbers[id(style)]
+
+    def appears_at(self):
+        '''
+        Return the zoom level at which each feature appears as a numpy array.
+        '''
+        return np.array([style.appears_at for style in self.styles], dtype=float).reshape(-1)[self.style_ids]
+
+    def style_hashes(self):
+        '''
+        Return a list of hashes of the feature name and each style, from which the fingerprints of the features are continued.
+        '''
+        hashes = []
+        for style in self.styles:
+            h = sha1(self.name.encode())
+            h.update(style_fingerprint(style))
+            hashes.append(h)
+        return hashes
+
+class ShapeTable(Table):
+    '''
+    Subclass of :class:`Table`
+
+    Columnar store of many areas or ways, kept as a few numpy arrays rather than one :class:`.Feature` per shape. The projected vertices of every shape are stored one after another in the (2,M) array :attr:`vertices` and shape i is made up of the columns :attr:`offsets`\\ [i] to :attr:`offsets`\\ [i+1]. The style of shape i is :attr:`styles`\\ [:attr:`style_ids`\\ [i]].
+
+    Shapes are added in chunks by :meth:`append` and the chunks are joined the first time the arrays are needed. Subclasses set the :class:`.Collection` used to draw the shapes.
+    '''
+    collection_type = None
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self._vertices = np.zeros((2,0))
+        self._offsets = np.zeros(1, dtype=int)
+        self._style_ids = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        return len(self._style_ids) + sum(len(chunk[2]) for chunk in self.chunks)
+
+    def __getstate__(self):
+        self.consolidate()
+        return self.__dict__.copy()
+
+    @property
+    def vertices(self):
+        self.consolidate()
+        return self._vertices
+
+    @property
+    def offsets(self):
+        self.consolidate()
+        return self._offsets
+
+    @property
+    def style_ids(self):
+        self.consolidate()
+        return self._style_ids
+
+    def append(self, vertices, offsets, style_ids, styles):
+        '''
+        Add the shapes given by the (2,M) numpy array of projected *vertices* and the *offsets* of each shape, where the style of shape i is *styles*\\ [*style_ids*\\ [i]].
+        '''
+        numbers = np.array([self.add_style(style) for style in styles], dtype=int)
+        offsets = np.asarray(offsets, dtype=int)
+        self.chunks.append((vertices[:,offsets[0]:offsets[-1]], np.diff(offsets), numbers[style_ids]))
+
+    def consolidate(self):
+        '''
+        Join the chunks added by :meth:`append` onto the arrays.
+        '''
+        if len(self.chunks) == 0:
+            return
+        counts = np.concatenate([np.diff(self._offsets)] + [chunk[1] for chunk in self.chunks])
+        self._vertices = np.concatenate([self._vertices] + [chunk[0] for chunk in self.chunks], axis=1)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._style_ids = np.concatenate([self._style_ids] + [chunk[2] for chunk in self.chunks])
+        self.chunks = []
+
+    def get_bboxes(self):
+        '''
+        Return the bounding boxes of the shapes as a (4,N) numpy array of the minimum x, maximum x, minimum y and maximum y coordinates.
+        '''
+        if len(self) == 0:
+            return np.zeros((4,0))
+        starts = self.offsets[:-1]
+        return np.array([np.minimum.reduceat(self.vertices[0], starts), np.maximum.reduceat(self.vertices[0], starts), np.minimum.reduceat(self.vertices[1], starts), np.maximum.reduceat(self.vertices[1], starts)])
+
+    def fingerprints(self):
+        '''
+        Return a list of the fingerprint of each shape. These are the same as the fingerprints of the equivalent :class:`.Area` or :class:`.Way`, see :meth:`.Feature.fingerprint`.
+        '''
+        prefixes = self.style_hashes()
+        fingerprints = []
+        for i, style_id in enumerate(self.style_ids):
+            h = prefixes[style_id].copy()
+            h.update(np.ascontiguousarray(self.vertices[:,self.offsets[i]:self.offsets[i+1]]).tobytes())
+            fingerprints.append(h.digest())
+        return fingerprints
+
+    def collections(self):
+        '''
+        Generate a :attr:`collection_type` for each style together with the indices of its shapes in the table.
+        '''
+        for style_id, style in enumerate(self.styles):
+            rows = np.flatnonzero(self.style_ids == style_id)
+            if len(rows) == 0:
+                continue
+            counts = self.offsets[rows+1] - self.offsets[rows]
+            columns = np.repeat(self.offsets[rows] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            yield self.collection_type(self.vertices[:,columns], np.concatenate([[0], np.cumsum(counts)]), style), rows
+
+class AreaTable(ShapeTable):
+    '''
+    Subclass of :class:`ShapeTable`
+
+    Columnar store of areas, drawn as :class:`.AreaCollection`. To add areas to a :class:`.Map` one would typically use :meth:`.add_areas`.
+    '''
+    name = 'Area'
+    collection_type = AreaCollection
+
+class WayTable(ShapeTable):
+    '''
+    Subclass of :class:`ShapeTable`
+
+    Columnar store of ways, drawn as :class:`.WayCollection`. Markers are not drawn. To add ways to a :class:`.Map` one would typically use :meth:`.add_ways`.
+    '''
+    name = 'Way'
+    collection_type = WayCollection
+
+class PointTable(Table):
+    '''
+    Subclass of :class:`Table`
+
+    Columnar store of many names or nodes, kept as numpy arrays rather than one :class:`.Name` per point. The projected locations are the columns of the (2,N) array :attr:`locations` and the label of point i is :attr:`labels`\\ [:attr:`label_ids`\\ [i]], so each distinct label is stored once. Points are added in chunks by :meth:`append` as for :class:`ShapeTable`.
+
+    The text of a point is only created by :meth:`plot` when it is needed, so the table holds no matplotlib artists.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.labels = []
+        self.label_numbers = {}
+        self.chunks = []
+        self._locations = np.zeros((2,0))
+        self._label_ids = np.zeros(0, dtype=np.int32)
+        self._style_ids = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._style_ids) + sum(len(chunk[2]) for chunk in self.chunks)
+
+    def __getstate__(self):
+        self.consolidate()
+        return self.__dict__.copy()
+
+    @property
+    def locations(self):
+        self.consolidate()
+        return self._locations
+
+    @property
+    def label_ids(self):
+        self.consolidate()
+        return self._label_ids
+
+    @property
+    def style_ids(self):
+        self.consolidate()
+        return self._style_ids
+
+    def add_label(self, label):
+        '''
+        Returns the index of the string *label* in :attr:`labels`, adding it if it is not already there.
+        '''
+        if label not in self.label_numbers:
+            self.label_numbers[label] = len(self.labels)
+            self.labels.append(label)
+        return self.label_numbers[label]
+
+    def append(self, locations, labels, style_ids, styles):
+        '''
+        Add the points given by the (2,N) numpy array of projected *locations* and the list of strings *labels*, where the style of point i is *styles*\\ [*style_ids*\\ [i]].
+        '''
+        numbers = np.array([self.add_style(style) for style in styles], dtype=np.int32)
+        label_ids = np.array([self.add_label(label) for label in labels], dtype=np.int32)
+        self.chunks.append((locations, label_ids, numbers[style_ids]))
+
+    def consolidate(self):
+        '''
+        Join the chunks added by :meth:`append` onto the arrays.
+        '''
+        if len(self.chunks) == 0:
+            return
+        self._locations = np.concatenate([self._locations] + [chunk[0] for chunk in self.chunks], axis=1)
+        self._label_ids = np.concatenate([self._label_ids] + [chunk[1] for chunk in self.chunks])
+        self._style_ids = np.concatenate([self._style_ids] + [chunk[2] for chunk in self.chunks])
+        self.chunks = []
+
+    def get_bboxes(self):
+        '''
+        Return the bounding boxes of the points, which are just the locations repeated, as a (4,N) numpy array.
+        '''
+        return self.locations[[0,0,1,1]]
+
+    def fingerprints(self):
+        '''
+        Return a list of the fingerprint of each point. These are the same as the fingerprints of the equivalent :class:`.Name` or :class:`.Node`, see :meth:`.Feature.fingerprint`.
+        '''
+        prefixes = self.style_hashes()
+        fingerprints = []
+        for i, style_id in enumerate(self.style_ids):
+            h = prefixes[style_id].copy()
+            h.update(self.labels[self.label_ids[i]].encode())
+            h.update(np.ascontiguousarray(self.locations[:,i]).tobytes())
+            fingerprints.append(h.digest())
+        return fingerprints
+
+    def plot(self, i, axes, zorder=3):
+        '''
+        Plot point *i* on *axes* in the same way as :meth:`.Name.plot` with the given *zorder* and return the text artist.
+        '''
+        style = self.styles[self.style_ids[i]]
+        return axes.text(self.locations[0,i], self.locations[1,i], self.labels[self.label_ids[i]], clip_on=True, wrap=False, in_layout=False, color=style.color, fontsize=style.fontsize, fontweight=style.fontweight, ha='center', multialignment='center', zorder=zorder)
+
+class NameTable(PointTable):
+    '''
+    Subclass of :class:`PointTable`
+
+    Columnar store of names. To add names to a :class:`.Map` one would typically use :meth:`.add_names`.
+    '''
+    name = 'Name'
+
+class NodeTable(PointTable):
+    '''
+    Subclass of :class:`PointTable`
+
+    Columnar store of nodes, labelled with the *text* of their :class:`.NodeStyle`. To add nodes to a :class:`.Map` one would typically use :meth:`.add_nodes`.
+    '''
+    name = 'Node'
@@ -1,11 +1,33 @@
+from hashlib import sha1
 import numpy as np
+from matplotlib.colors import Colormap
+
+def style_fingerprint(style):
+    '''
+    Return a hash (bytes) of the attributes of *style* which is the same every time the program is run. Numpy arrays are hashed by their contents, since their repr leaves out the middle of large arrays, and colormaps by their name and colours, since their repr includes their address in memory. Other values are hashed by their repr.
+    '''
+    h = sha1()
+    for key, value in sorted(vars(style).items()):
+        h.update(key.encode())
+        if isinstance(value, Colormap):
+            h.update(value.name.encode())
+            h.update(np.ascontiguousarray(value(np.linspace(0, 1, value.N))).tobytes())
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            h.update(repr((value.dtype.str, value.shape)).encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(repr(value).encode())
+    return h.digest()
 
 class Style():
     '''
     Generic style. Features will become visible at `zoom level <https://wiki.openstreetmap.org/wiki/Zoom_levels>`_ *appears_at*, the default value is zero (visible at every zoom level).
+
+    When drawing a tile pyramid (see :meth:`.Map.draw_zoom_levels`), zoom levels are built by downsampling the tiles of the next zoom level. Setting *downsample* to False means that any zoom level where features with this style are visible is drawn from the features instead, e.g. so that names keep their font size.
     '''
-    def __init__(self, appears_at=0):
+    def __init__(self, appears_at=0, downsample=True):
         self.appears_at = appears_at
+        self.downsample = downsample
 
     def update(self, zoom):
         '''
@@ -19,8 +41,8 @@ class AreaStyle(Style):
 
     Area style which determines the colour of the area, whether it is filled and a hatching.
     '''
-    def __init__(self, appears_at=0, color='black', fill=True, hatch=''):
-        super().__init__(appears_at)
+    def __init__(self, appears_at=0, color='black', fill=True, hatch='', downsample=True):
+        super().__init__(appears_at, downsample)
         self.color = color
         self.fill = fill
         self.hatch = hatch
@@ -31,8 +53,8 @@ class WayStyle(Style):
 
     Way style which determines the colour of the way, the linestyle, linewidth, markerstyle and markersize.
     '''
-    def __init__(self, appears_at=0, color='black', linestyle='-', linewidth=1.0, markerstyle='', markersize=0):
-        super().__init__(appears_at)
+    def __init__(self, appears_at=0, color='black', linestyle='-', linewidth=1.0, markerstyle='', markersize=0, downsample=True):
+        super().__init__(appears_at, downsample)
         self.color = color
         self.linestyle = linestyle
         self.linewidth = linewidth
@@ -43,22 +65,23 @@ class NameStyle(Style):
     '''
     Subclass of :class:`Style`.
 
-    Name style which determines the colour of the name, the fontsize and the fontweight.
+    Name style which determines the colour of the name, the fontsize and the fontweight. When overlapping labels are removed (see :meth:`.Map.place_labels`), labels with a higher *rank* are placed first.
     '''
-    def __init__(self, appears_at=0, color='black', fontsize=7, fontweight='normal'):
-        super().__init__(appears_at)
+    def __init__(self, appears_at=0, color='black', fontsize=7, fontweight='normal', downsample=True, rank=0):
+        super().__init__(appears_at, downsample)
         self.color = color
         self.fontsize = fontsize
         self.fontweight = fontweight
+        self.rank = rank
 
 class NodeStyle(NameStyle):
     '''
     Subclass of :class:`NameStyle`.
 
-    Node style which determines the colour of the node, the text label, the fontsize and the fontweight.
+    Node style which determines the colour of the node, the text label, the fontsize, the fontweight and the *rank* used when overlapping labels are removed.
     '''
-    def __init__(self, appears_at=0, color='black', text='P', fontsize=7, fontweight='bold'):
-        super().__init__(appears_at, color, fontsize, fontweight)
+    def __init__(self, appears_at=0, color='black', text='P', fontsize=7, fontweight='bold', downsample=True, rank=0):
+        super().__init__(appears_at, color, fontsize, fontweight, downsample, rank)
         self.text = text
 
 class ElevationStyle():
@@ -20,6 +20,6 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.5',
-    install_requires=['numpy>=1.3.0', 'scipy>=0.9.0', 'matplotlib>=3.0.0']
+    python_requires='>=3.7',
+    install_requires=['numpy>=1.3.0', 'scipy>=0.9.0', 'matplotlib>=3.0.0', 'pillow>=9.1']
 )
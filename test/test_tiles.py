@@ -0,0 +1,406 @@
+from sys import path
+path.insert(0, '..')
+from os import makedirs, listdir, chdir, getcwd
+from shutil import rmtree
+from tempfile import mkdtemp
+import numpy as np
+from cartograph import Map
+from cartograph.style import AreaStyle, WayStyle, NameStyle, NodeStyle, ElevationStyle, style_fingerprint
+from matplotlib import colormaps
+from cartograph.sink import DirectorySink, MBTilesSink
+from cartograph.io import load_osm
+from cartograph.projection import deg2num, tile_extents
+from cartograph.index import GridIndex
+from cartograph.simplify import douglas_peucker
+from cartograph.encode import Encoder
+from cartograph.feature import DEMElevation
+from cartograph.stats import Stats
+from cartograph.serve import TileServer, TileRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+
+cwd, workdir = getcwd(), mkdtemp() # the tiles and other files are written here and removed at the end
+chdir(workdir)
+
+map = Map()
+map.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+map.set_background_color('#a0c8f0')
+
+park = np.array([[51.505, 51.505, 51.515, 51.515], [-0.14, -0.12, -0.12, -0.14]]) # degrees of latitude / longitude
+map.add_area(park, AreaStyle(color='green'))
+
+river = np.zeros((2,100))
+river[0] = np.linspace(51.50, 51.52, 100)
+river[1] = -0.125 + 0.01*np.sin(np.linspace(0, 4*np.pi, 100))
+map.add_way(river, WayStyle(color='blue', linewidth=2, appears_at=11))
+
+map.add_name('A. Park', np.array([51.51, -0.13]), NameStyle(fontsize=5, appears_at=12))
+
+tiles = np.array(list(map.tiles(12))).T
+assert np.array_equal(deg2num(np.array([51.51]), np.array([-0.13]), 12), [[2046], [1361]])
+assert np.allclose(tile_extents(tiles[0], tiles[1], 12), [map.tile_bounds(x, x+1, y, y+1, 12).reshape(-1) for x, y in tiles.T])
+
+rng = np.random.default_rng(0)
+corners = rng.uniform(0, 100, size=(2, 2, 1000))
+corners[:,1,:50] = corners[:,0,:50] + rng.uniform(0, 100, size=(2, 50)) # some items spanning many cells
+bboxes = np.array([corners[0].min(axis=0), corners[0].max(axis=0), corners[1].min(axis=0), corners[1].max(axis=0)])
+index = GridIndex(bboxes)
+assert index.coarse is not None and index.coarse.cells < index.cells
+for bounds in rng.uniform(0, 100, size=(20, 2, 2)):
+    bounds.sort(axis=1)
+    brute = np.flatnonzero((bboxes[0] <= bounds[0,1]) & (bounds[0,0] <= bboxes[1]) & (bboxes[2] <= bounds[1,1]) & (bounds[1,0] <= bboxes[3]))
+    assert np.array_equal(index.query(bounds), brute)
+
+x = np.linspace(0, 10, 500)
+line = np.array([x, np.cumsum(rng.normal(0, 0.1, 500))])
+for tolerance in [0.01, 0.1, 1.0]:
+    simplified = douglas_peucker(line, tolerance)
+    kept = np.searchsorted(x, simplified[0])
+    assert np.array_equal(line[:,kept], simplified) and kept[0] == 0 and kept[-1] == 499 and len(kept) < 500
+    part = np.searchsorted(kept, np.arange(500), side='right') - 1
+    start, stop = line[:,kept[np.minimum(part, len(kept) - 2)]], line[:,kept[np.minimum(part + 1, len(kept) - 1)]]
+    (dx, dy), (px, py) = stop - start, line - start
+    assert np.all(np.abs(px*dy - py*dx) <= tolerance * np.hypot(dx, dy) + 1e-12)
+
+map.create_figure(1, 1)
+map.plot()
+map.set_zoom(12)
+bounds = map.tile_bounds(2046, 2047, 1361, 1362, 12)
+assert map.query(bounds, 12).tolist() == [0, 1, 2] and map.query(bounds, 10).tolist() == [0]
+assert len(map.query(map.tile_bounds(2044, 2045, 1360, 1361, 12), 12)) == 0
+map.cull(bounds)
+assert map.visible == {0, 1, 2} and all(artist.get_visible() for artist in map.features[0].artists) # the park, river and name
+
+makedirs('tiles', exist_ok=True)
+makedirs('tiles_parallel', exist_ok=True)
+map.draw_zoom_levels(10, 13, directory='tiles', disp=True)
+map.draw_zoom_levels(10, 13, directory='tiles_parallel', disp=True, workers=2)
+makedirs('tiles_metatile', exist_ok=True)
+map.draw_zoom_levels(10, 13, directory='tiles_metatile', disp=True, metatile=4)
+with MBTilesSink('tiles.mbtiles') as sink:
+    map.draw_zoom_levels(10, 13, sink=sink, workers=2)
+with MBTilesSink('tiles_pipeline.mbtiles') as sink:
+    map.draw_zoom_levels(10, 13, sink=sink, metatile=4, threads=2)
+    assert all(sink.read(x, y, 12) == DirectorySink('tiles_metatile').read(x, y, 12) for x, y in map.tiles(12))
+
+makedirs('tiles_linked', exist_ok=True)
+summary = map.draw_zoom_levels(10, 13, sink=DirectorySink('tiles_linked', link='hard'), skip_blank=True, disp=True)
+
+serial = {(x, y, zoom):DirectorySink('tiles').read(x, y, zoom) for zoom in range(10, 13) for x, y in map.tiles(zoom)}
+label = tuple(deg2num(51.51, -0.13, 12))
+seams = {(label[0] // 2, label[1] // 2, 11), (label[0] // 2, label[1] // 2 + 1, 11), label + (12,), (label[0], label[1] + 1, 12)} # the label is not clipped at the edges of tiles within a metatile
+assert all(DirectorySink('tiles_parallel').read(*tile) == data for tile, data in serial.items())
+assert all(DirectorySink('tiles_metatile').read(*tile) == data for tile, data in serial.items() if tile not in seams)
+blank = [tile for tile, data in serial.items() if map.is_blank(map.encoder.decode(data))]
+assert summary['blank'] == len(blank) > 0 and summary['tiles'] == len(serial) - len(blank)
+assert all(DirectorySink('tiles_linked').read(*tile) == (None if tile in blank else data) for tile, data in serial.items())
+stale = DirectorySink('tiles_linked')
+stale.write(*blank[0], serial[label + (12,)])
+map.draw_zoom_levels(blank[0][2], blank[0][2] + 1, sink=stale, skip_blank=True)
+assert stale.read(*blank[0]) is None # a tile stored before is deleted when it is drawn blank
+image = map.encoder.decode(serial[label + (12,)])
+assert np.array_equal(Encoder().decode(Encoder().encode(image)), image)
+quantized = Encoder(quantize=True, colors=16).decode(Encoder(quantize=True, colors=16).encode(image))
+assert len(np.unique(quantized.reshape(-1, 4), axis=0)) <= 16 and np.abs(quantized.astype(int) - image).mean() < 8
+assert np.array_equal(Encoder('webp', lossless=True).decode(Encoder('webp', lossless=True).encode(image)), image)
+assert np.abs(Encoder('webp').decode(Encoder('webp').encode(image)).astype(int) - image).mean() < 8
+assert np.abs(Encoder('jpeg').decode(Encoder('jpeg').encode(image)).astype(int) - image).mean() < 8 # the tile is opaque
+map.set_encoder('webp')
+with MBTilesSink('tiles_webp.mbtiles') as sink:
+    map.draw_zoom_levels(10, sink=sink)
+    assert sink.connection.execute("SELECT value FROM metadata WHERE name = 'format'").fetchone()[0] == 'webp'
+    assert np.abs(map.encoder.decode(sink.read(*list(map.tiles(10))[0], 10)).astype(int) - map.encoder.decode(DirectorySink('tiles').read(*list(map.tiles(10))[0], 10))).mean() < 8
+map.set_encoder('png')
+
+makedirs('tiles_duplicates', exist_ok=True)
+summary = map.draw_zoom_levels(10, 13, sink=DirectorySink('tiles_duplicates', link='hard'))
+assert summary['duplicates'] == len(serial) - len(set(serial.values())) > 0
+
+incremental = Map()
+incremental.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+incremental.add_area(park, AreaStyle(color='green'))
+incremental.add_way(river, WayStyle(color='blue', linewidth=2, appears_at=11))
+incremental.add_name('A. Park', np.array([51.51, -0.13]), NameStyle(fontsize=5, appears_at=12))
+incremental.add_way(np.array([[51.502, 51.518], [-0.16, -0.16]]), WayStyle(color='blue')) # a stream away from the park, removed below
+rmtree('tiles_incremental', ignore_errors=True) # the manifest of an earlier run would leave every tile unchanged
+makedirs('tiles_incremental')
+first = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True)
+summary = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True)
+assert first['tiles'] > 0 and summary['tiles'] == 0 and summary['unchanged'] == first['tiles'] + first['blank']
+
+def tiles_with(feature):
+    i = incremental.features.index(feature)
+    return set((x, y, zoom) for zoom in range(10, 13) for x, y in incremental.tiles(zoom) if i in incremental.query(incremental.tile_bounds(x, x+1, y, y+1, zoom), zoom))
+incremental.areas[0].style.color = 'red'
+summary = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True)
+assert summary['tiles'] + summary['blank'] == len(tiles_with(incremental.areas[0])) > 0 and summary['unchanged'] == first['tiles'] + first['blank'] - len(tiles_with(incremental.areas[0]))
+
+stream_tiles = tiles_with(incremental.ways[1])
+incremental.ways.pop()
+incremental.build_index()
+empty = set(tile for tile in stream_tiles if incremental.tile_fingerprint(*tile) is None)
+summary = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True)
+assert summary['deleted'] == len(empty) > 0 and summary['tiles'] + summary['blank'] == len(stream_tiles - empty)
+assert all(DirectorySink('tiles_incremental').read(*tile) is None for tile in empty)
+summary = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True, metatile=2)
+assert summary['unchanged'] == 0 and summary['tiles'] > 0 and incremental.metatile == 1 # labels can be drawn differently within a metatile
+summary = incremental.draw_zoom_levels(10, 13, directory='tiles_incremental', incremental=True, metatile=2)
+assert summary['tiles'] + summary['blank'] == 0 and summary['unchanged'] > 0
+
+assert style_fingerprint(ElevationStyle(colormap=colormaps['terrain'])) == style_fingerprint(ElevationStyle(colormap=colormaps['terrain']))
+levels = np.arange(0, 2000, 1.0)
+assert style_fingerprint(ElevationStyle(contour_levels=levels)) != style_fingerprint(ElevationStyle(contour_levels=np.where(levels == 1000, 1000.5, levels)))
+
+linked = Map()
+linked.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+square = np.array([[51.505, 51.505, 51.507, 51.507], [-0.13, -0.128, -0.128, -0.13]]) # degrees of latitude / longitude
+square_styles = [AreaStyle(color='green'), AreaStyle(color='green')]
+linked.add_area(square, square_styles[0])
+linked.add_area(square - np.array([[0], [360 / 2**12]]), square_styles[1]) # the same square one tile to the west at zoom level 12
+for link in ['hard', 'symbolic']:
+    rmtree('tiles_%s' % link, ignore_errors=True)
+    makedirs('tiles_%s' % link)
+    square_styles[1].color = 'green'
+    summary = linked.draw_zoom_levels(12, sink=DirectorySink('tiles_%s' % link, link=link), incremental=True)
+    assert summary['duplicates'] == 2 # the squares and the empty tiles above them
+    square_styles[1].color = 'red'
+    summary = linked.draw_zoom_levels(12, sink=DirectorySink('tiles_%s' % link, link=link), incremental=True)
+    assert summary['tiles'] == 2 and summary['unchanged'] == 2 # the red square and the empty tile above it are drawn again
+    makedirs('tiles_%s_fresh' % link, exist_ok=True)
+    linked.draw_zoom_levels(12, directory='tiles_%s_fresh' % link)
+    assert all(DirectorySink('tiles_%s' % link).read(x, y, 12) == DirectorySink('tiles_%s_fresh' % link).read(x, y, 12) for x in [2045, 2046] for y in [1361, 1362])
+
+rmtree('tiles_sharded', ignore_errors=True) # the journals of an earlier run would skip every block
+makedirs('tiles_sharded')
+shards = [map.draw_zoom_levels(10, 13, directory='tiles_sharded', journal='tiles_sharded/journal', shard='%d/2' % i, disp=True) for i in range(2)]
+assert shards[0]['tiles'] + shards[1]['tiles'] == 21 and abs(shards[0]['tiles'] - shards[1]['tiles']) <= 3
+assert all(DirectorySink('tiles_sharded').read(x, y, 12) == DirectorySink('tiles').read(x, y, 12) for x, y in map.tiles(12))
+with open('tiles_sharded/journal.1-of-2') as f:
+    lines = f.readlines()
+with open('tiles_sharded/journal.1-of-2', 'w') as f:
+    f.writelines(lines[:-3] + [lines[-3][:4]])
+summary = map.draw_zoom_levels(10, 13, directory='tiles_sharded', journal='tiles_sharded/journal', shard=(1, 2))
+assert summary['tiles'] == 3 and summary['resumed'] == shards[1]['tiles'] - 3
+assert map.draw_zoom_levels(10, 13, directory='tiles_sharded', journal='tiles_sharded/journal', shard=(1, 2))['tiles'] == 0
+
+makedirs('tiles_simplified', exist_ok=True)
+map.draw_zoom_levels(10, 13, directory='tiles_simplified', simplify=0.5)
+assert map.features[1].simplified[1].shape[1] < river.shape[1]
+map.render_tile(2046, 1361, 12)
+assert map.simplify is None and map.tolerance is None
+assert all(np.abs(map.encoder.decode(DirectorySink('tiles_simplified').read(x, y, zoom)).astype(int) - map.encoder.decode(serial[(x, y, zoom)])).mean() < 1 for x, y, zoom in serial)
+
+makedirs('tiles_pyramid', exist_ok=True)
+stats = Stats()
+summary = map.draw_zoom_levels(10, 14, directory='tiles_pyramid', pyramid=True, stats=stats)
+assert stats.summary()['tiles'] == summary['tiles'] and stats.summary()['bytes'] > 0 and 'downsample' in stats.summary()['stages']
+assert all(np.abs(map.encoder.decode(DirectorySink('tiles_pyramid').read(x, y, 12)).astype(int) - map.encoder.decode(serial[(x, y, 12)])).mean() < 1.5 for x, y in map.tiles(12)) # zoom 12 is downsampled
+for style, name, value in [(map.areas[0].style, 'downsample', False), (map.names[0].style, 'appears_at', 13)]: # either draws zoom 12 from the features
+    previous = getattr(style, name)
+    setattr(style, name, value)
+    records = []
+    map.draw_zoom_levels(10, 14, directory='tiles_pyramid', pyramid=True, stats=records.append)
+    setattr(style, name, previous)
+    assert not any('downsample' in record for record in records if record['zoom'] == 12) and sum(record['tiles'] for record in records if record['zoom'] == 12) == map.number_of_tiles(12)
+    if name == 'downsample':
+        assert all(DirectorySink('tiles_pyramid').read(x, y, 12) == serial[(x, y, 12)] for x, y in map.tiles(12))
+
+makedirs('tiles_batch', exist_ok=True)
+records = []
+map.draw_zoom_levels(10, 13, directory='tiles_batch', batch=True, workers=2, stats=records.append)
+assert len(records) == summary['tiles'] - map.number_of_tiles(13) and all(record['draw'] > 0 for record in records)
+assert not map.batch and all(DirectorySink('tiles_batch').read(*tile) == data for tile, data in serial.items())
+
+makedirs('tiles_coverage', exist_ok=True)
+n_tiles = sum(map.number_of_tiles(zoom) for zoom in range(10, 14))
+summary = map.draw_zoom_levels(10, 14, directory='tiles_coverage', coverage=park)
+assert map.coverage is None and sum(map.number_of_tiles(zoom) for zoom in range(10, 14)) == n_tiles
+map.set_coverage(park)
+assert summary['tiles'] == sum(map.number_of_tiles(zoom) for zoom in range(10, 14)) < n_tiles
+map.set_coverage(None)
+map.draw_zoom_levels(10, 14, directory='tiles_coverage', coverage='features', incremental=True)
+for options in [{'workers':2, 'threads':2}, {'metatile':2, 'coverage':park}]:
+    try:
+        map.draw_zoom_levels(10, 13, directory='tiles_coverage', **options)
+        assert False
+    except ValueError:
+        pass
+
+rmtree('tiles_served', ignore_errors=True) # tiles cached by an earlier run would not be drawn
+with TileServer(map, workers=2, cache_directory='tiles_served') as server, ThreadPoolExecutor(8) as pool:
+    served = list(pool.map(lambda tile: server.get(*tile), [(2046, 1361, 12)]*6 + [(2045, 1361, 12), (0, 0, 12)]))
+    assert served[0] == served[5] == DirectorySink('tiles').read(2046, 1361, 12) and served[6] is not None and served[7] is None
+    assert server.counts['drawn'] == 2 and server.get(2046, 1361, 12) == served[0]
+    httpd = ThreadingHTTPServer(('localhost', 0), TileRequestHandler)
+    httpd.tiles = server
+    httpd.verbose = False
+    pool.submit(httpd.serve_forever)
+    url = 'http://localhost:%d/%%s' % httpd.server_address[1]
+    assert urlopen(url % '12/2046/1361.png').read() == served[0]
+    server.pool.terminate() # drawing a tile which is not cached now fails
+    for tile, code in [('12/2044/1361.png', 500), ('12/0/0.png', 404), ('tile.png', 404)]:
+        try:
+            urlopen(url % tile)
+            assert False
+        except HTTPError as error:
+            assert error.code == code
+    httpd.shutdown()
+    httpd.server_close()
+
+bulk = Map()
+bulk.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+bulk.set_background_color('#a0c8f0')
+bulk.add_areas(park, [0, 4], AreaStyle(color='green'))
+bulk.add_ways(np.concatenate([river, river + 0.002], axis=1), [0, 100, 200], [WayStyle(color='blue', linewidth=2), WayStyle(color='red', appears_at=11)])
+bulk.add_names(['A. Park', 'B. Park'], np.array([[51.51, 51.505], [-0.13, -0.12]]), NameStyle(fontsize=5, appears_at=12))
+bulk.add_nodes(np.array([[51.507], [-0.125]]), NodeStyle())
+makedirs('tiles_bulk', exist_ok=True)
+bulk.draw_zoom_levels(10, 13, directory='tiles_bulk')
+
+objects = Map() # the same map added one feature at a time
+objects.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+objects.set_background_color('#a0c8f0')
+objects.add_area(park, AreaStyle(color='green'))
+objects.add_way(river, WayStyle(color='blue', linewidth=2))
+objects.add_way(river + 0.002, WayStyle(color='red', appears_at=11))
+objects.add_name('A. Park', np.array([51.51, -0.13]), NameStyle(fontsize=5, appears_at=12))
+objects.add_name('B. Park', np.array([51.505, -0.12]), NameStyle(fontsize=5, appears_at=12))
+objects.add_node(np.array([51.507, -0.125]), NodeStyle())
+makedirs('tiles_objects', exist_ok=True)
+objects.draw_zoom_levels(10, 13, directory='tiles_objects')
+bulk.build_index()
+objects.build_index()
+for zoom in range(10, 13):
+    assert list(bulk.tiles(zoom)) == list(objects.tiles(zoom))
+    for x, y in bulk.tiles(zoom):
+        assert bulk.tile_fingerprint(x, y, zoom) == objects.tile_fingerprint(x, y, zoom)
+        assert DirectorySink('tiles_bulk').read(x, y, zoom) == DirectorySink('tiles_objects').read(x, y, zoom)
+
+def pyramid_levels(style, bulk_path):
+    labels = Map()
+    labels.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+    location = np.array([[51.51], [-0.13]])
+    if isinstance(style, NodeStyle):
+        labels.add_nodes(location, style) if bulk_path else labels.add_node(location[:,0], style)
+    else:
+        labels.add_names(['A. Park'], location, style) if bulk_path else labels.add_name('A. Park', location[:,0], style)
+    labels.build_index()
+    return [labels.can_downsample(zoom) for zoom in range(10, 13)]
+for style, expected in [(NameStyle(fontsize=5, downsample=False), [False, False, False]), (NodeStyle(downsample=False), [False, False, False]), (NameStyle(fontsize=5, appears_at=12), [True, False, True]), (NodeStyle(appears_at=11), [False, True, True])]:
+    assert pyramid_levels(style, False) == pyramid_levels(style, True) == expected
+
+bulk.add_name('C. Park', np.array([51.5101, -0.1301]), NameStyle(fontsize=5, appears_at=12, rank=1))
+makedirs('tiles_declutter', exist_ok=True)
+bulk.draw_zoom_levels(10, 13, directory='tiles_declutter', declutter=True)
+assert not bulk.place_labels(12)[-2] and bulk.place_labels(12)[1]
+assert not bulk.declutter
+
+with open('test.osm', 'w') as f:
+    f.write('''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="51.505" lon="-0.14"/>
+ <node id="2" lat="51.505" lon="-0.12"/>
+ <node id="3" lat="51.515" lon="-0.12"/>
+ <node id="4" lat="51.515" lon="-0.14"/>
+ <node id="5" lat="51.51" lon="-0.13"><tag k="name" v="A. Park"/><tag k="leisure" v="park"/></node>
+ <node id="6" lat="60.0" lon="10.0"/>
+ <node id="7" lat="51.507" lon="-0.125"><tag k="amenity" v="bench"/></node>
+ <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/><tag k="leisure" v="park"/></way>
+ <way id="11"><nd ref="1"/><nd ref="3"/><tag k="highway" v="primary"/></way>
+ <way id="12"><nd ref="6"/><nd ref="6"/><tag k="highway" v="primary"/></way>
+</osm>
+''')
+
+osm = Map()
+osm.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+rules = [('leisure', 'park', AreaStyle(color='green')), ('leisure', 'park', NameStyle(fontsize=5)), ('highway', None, WayStyle(color='red')), ('amenity', None, NameStyle(fontsize=5)), ('amenity', 'bench', NodeStyle())]
+summary = load_osm(osm, 'test.osm', rules)
+assert summary == {'areas':1, 'ways':1, 'names':1, 'nodes':1}
+makedirs('tiles_osm', exist_ok=True)
+osm.draw_zoom_levels(10, 13, directory='tiles_osm')
+
+dem = np.add.outer(np.linspace(100, 0, 121), np.linspace(0, 50, 121)) # elevation on a grid from north to south and west to east
+np.save('dem.npy', dem)
+relief = Map()
+relief.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+sampled = DEMElevation('dem.npy', ElevationStyle(), extent=(51.4, 51.6, -0.3, 0.0))
+lat, lon = np.array([51.6, 51.4, 51.6, 51.5]), np.array([-0.3, 0.0, 0.0, -0.15]) # the corners and the middle of the grid
+assert np.allclose(sampled.sample(lat, lon), [dem[0,0], dem[-1,-1], dem[0,-1], dem[60,60]])
+assert np.isnan(sampled.sample(np.array([51.7, 51.5]), np.array([-0.1, 0.1]))).all() # outside the grid
+hgt = (np.arange(25).reshape(5, 5) * 10).astype('>i2')
+hgt[0,0] = -32768 # void
+makedirs('tiles_hgt', exist_ok=True)
+hgt.tofile('tiles_hgt/N51W001.hgt')
+sampled = DEMElevation('tiles_hgt/N51W001.hgt', ElevationStyle())
+assert sampled.extent == (51, 52, -1, 0) # from the file name
+values = sampled.sample(np.array([52.0, 52.0, 51.0, 51.5]), np.array([-1.0, -0.75, 0.0, -0.5]))
+assert np.isnan(values[0]) and np.allclose(values[1:], [hgt[0,1], hgt[4,4], hgt[2,2]])
+
+relief.add_dem('dem.npy', ElevationStyle(vmin=0, vmax=150, contour_levels=np.arange(0, 150, 10), contour_appears_at=12), extent=(51.4, 51.6, -0.3, 0.0))
+makedirs('tiles_dem', exist_ok=True)
+relief.draw_zoom_levels(10, 13, directory='tiles_dem')
+
+relief.create_figure(1, 1)
+relief.plot()
+relief.set_zoom(12)
+geometry = relief.elevation.contour_geometry(relief.axes)
+layers = {12:relief.elevation.layer}
+relief.set_zoom(13)
+layers[13] = relief.elevation.layer
+assert layers[13] is not layers[12]
+assert relief.elevation.contour_geometry(relief.axes) is geometry
+relief.set_zoom(12)
+assert relief.elevation.layer is layers[12] # the layers of each zoom level are kept
+relief.elevation.contour_lines = None
+uncached = relief.elevation.contour_geometry(relief.axes)
+assert len(uncached) == len(geometry) and all(level == uncached_level and np.array_equal(line, uncached_line) for (level, line), (uncached_level, uncached_line) in zip(geometry, uncached))
+relief.set_zoom(13)
+layer = relief.elevation.layer
+assert layer is layers[13]
+shown = 0
+for x, y in relief.tiles(13):
+    bounds = relief.tile_bounds(x, x+1, y, y+1, 13)
+    relief.cull(bounds)
+    near = [i for i, line in enumerate(layer.lines) if line[0].min() <= bounds[0,1] and bounds[0,0] <= line[0].max() and line[1].min() <= bounds[1,1] and bounds[1,0] <= line[1].max()]
+    assert layer.line_index.query(bounds).tolist() == near and len(layer.collection.get_segments()) == len(near) < len(layer.lines)
+    shown += len(near)
+assert shown > 0
+
+relief.set_relief_cache('tiles_relief')
+makedirs('tiles_dem_cached', exist_ok=True)
+relief.draw_zoom_levels(10, 13, directory='tiles_dem_cached', workers=2)
+rmtree('tiles_relief_colormap', ignore_errors=True) # dem.npy is written again, so its relief is cached again
+cached = Map()
+cached.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+for colormap in [colormaps['terrain'], colormaps['terrain']]: # equal colormaps which are different objects share the cached relief
+    cached.add_dem('dem.npy', ElevationStyle(colormap=colormap, vmin=0, vmax=150), extent=(51.4, 51.6, -0.3, 0.0))
+    cached.set_relief_cache('tiles_relief_colormap')
+    makedirs('tiles_dem_colormap', exist_ok=True)
+    cached.draw_zoom_levels(10, 11, directory='tiles_dem_colormap')
+    assert len(listdir('tiles_relief_colormap')) == 1
+
+relief.add_dem('dem.npy', ElevationStyle(vmin=0, vmax=150, contour_levels=np.arange(0, 150, 10), contour_appears_at=12), extent=(51.4, 51.6, -0.3, 0.0), tiled=True)
+makedirs('tiles_dem_tiled', exist_ok=True)
+relief.draw_zoom_levels(10, 13, directory='tiles_dem_tiled', metatile=2)
+relief.elevation.set_tiled(cache_size=4)
+relief.draw_zoom_levels(12, 13, directory='tiles_dem_tiled', metatile=2)
+assert len(relief.elevation.cache) == 4 # the least recently used grids are dropped
+
+seams = {}
+for tiled in [False, True]:
+    seam = Map()
+    seam.bound_by_osm_tiles(10, (51.50, -0.15), (51.52, -0.10)) # degrees of latitude / longitude
+    seam.add_dem('dem.npy', ElevationStyle(vmin=0, vmax=150, hillshade_alpha=0), extent=(51.4, 51.6, -0.3, 0.0), tiled=tiled)
+    makedirs('tiles_seam_%d' % tiled, exist_ok=True)
+    seam.draw_zoom_levels(12, 13, directory='tiles_seam_%d' % tiled)
+    seams[tiled] = {(x, y):seam.encoder.decode(DirectorySink('tiles_seam_%d' % tiled).read(x, y, 12)).astype(int) for x, y in seam.tiles(12)}
+inner = [(x, y) for x, y in seams[True] if all(neighbour in seams[True] for neighbour in [(x-1, y), (x+1, y), (x, y-1), (x, y+1)])] # the outer tiles are cut off by the map bounds
+assert inner
+for tile in inner:
+    difference = np.abs(seams[True][tile] - seams[False][tile])
+    assert all(strip.mean() < 1 for strip in [difference[:4], difference[-4:], difference[:,:4], difference[:,-4:]]) # the tiled relief continues across the tile edges
+
+chdir(cwd)
+rmtree(workdir)